@@ -0,0 +1,244 @@
+"""
+The MIT License (MIT)
+Copyright © 2021 Walkline Wang (https://walkline.wang)
+Gitee: https://gitee.com/walkline/micropython-new-fontlib
+"""
+import os
+import ast
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from fontlib import FontLib, FontLibHeader, FontLibStats
+from fontmaker import build_font_data, encode_glyph, rank_characters
+
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_FILE = os.path.join(CURRENT_DIR, 'main.py')
+
+CONFIGS = {
+	'default': {},
+	'keep_open': {'keep_open': True},
+	'page16': {'page_size': 16, 'keep_open': True},
+	'cache8k': {'cache_size': 8192, 'keep_open': True},
+	'gap256': {'read_gap': 256, 'keep_open': True},
+	'memory': {'in_memory': True},
+	'coverage': {'coverage': True, 'keep_open': True},
+	'ranges': {'range_table': True, 'keep_open': True},
+	'hot': {'hot_chars': None, 'keep_open': True},
+	'idx': {'index_cache': 1024, 'keep_open': True},
+}
+
+
+def load_corpora(path=CORPUS_FILE):
+	'''读取 main.py 中模块级别的字符串变量，返回 {变量名: 文本}'''
+	with open(path, 'r', encoding='utf-8') as corpus_file:
+		tree = ast.parse(corpus_file.read())
+
+	corpora = {}
+	for node in tree.body:
+		if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+			for target in node.targets:
+				corpora[target.id] = node.value.value.replace('\r\n', '\n')
+
+	return corpora
+
+
+def gb2312_order():
+	'''按 GB2312 编码顺序返回所有字符的 Unicode 值，与 FontMaker 生成的索引表顺序相同'''
+	unicode_list = []
+	for high in range(0xa1, 0xf8):
+		for low in range(0xa1, 0xff):
+			try:
+				unicode_list.append(ord(bytes((high, low)).decode('gb2312')))
+			except UnicodeDecodeError:
+				pass
+
+	return unicode_list
+
+
+def make_glyph(rng, width, height):
+	'''生成由几条随机横线和竖线组成的点阵，四周留出 1 像素空白，比随机数据更接近真实字符的稀疏程度'''
+	rows = [0] * height
+
+	for _ in range(rng.randint(2, 6)):
+		x = rng.randint(1, width - 2)
+		y = rng.randint(1, height - 2)
+
+		if rng.random() < 0.5:
+			length = rng.randint(1, width - 1 - x)
+			for col in range(x, x + length):
+				rows[y] |= 1 << (width - 1 - col)
+		else:
+			length = rng.randint(1, height - 1 - y)
+			for row in range(y, y + length):
+				rows[row] |= 1 << (width - 1 - x)
+
+	return encode_glyph(rows, width, height, FontLibHeader.SCAN_MODE_VERTICAL, FontLibHeader.BYTE_ORDER_LSB)
+
+
+def make_font(path, glyphs, width, height, version=1, sort=False, corpus='', seed=0, compress=False):
+	'''生成测试字库，总是收录 corpus 中的字符，其余字符随机选取，索引表按 GB2312 顺序排列'''
+	rng = random.Random(seed)
+
+	pool = gb2312_order()
+	pool += [unicode for unicode in range(0x4e00, 0xa000) if unicode not in set(pool)]
+	rank = {unicode: index for index, unicode in enumerate(pool)}
+
+	wanted = set(ord(char) for char in corpus if ord(char) > FontLib.ASCII_END)
+	rest = [unicode for unicode in pool if unicode not in wanted]
+	rng.shuffle(rest)
+
+	unicode_list = sorted(wanted | set(rest[:max(0, glyphs - len(wanted))]), key=lambda unicode: rank.get(unicode, unicode))
+
+	glyph_dict = {unicode: make_glyph(rng, width, height) for unicode in range(FontLib.ASCII_START, FontLib.ASCII_END + 1)}
+	for unicode in unicode_list:
+		glyph_dict[unicode] = make_glyph(rng, width, height)
+
+	data = build_font_data(glyph_dict, width, height, FontLibHeader.SCAN_MODE_VERTICAL, FontLibHeader.BYTE_ORDER_LSB, version, sort, compress=compress)
+	with open(path, 'wb') as font_file:
+		font_file.write(data)
+
+	return len(data)
+
+
+def index_sorted(path):
+	'''字库的索引表是否按 Unicode 排序，未排序时 page_size 不起作用'''
+	with open(path, 'rb') as font_file:
+		header_data = font_file.read(FontLibHeader.LENGTH_V2)
+
+	if header_data[:4] != b'FMUZ':
+		header_data = header_data[:FontLibHeader.LENGTH]
+
+	return FontLibHeader(memoryview(header_data)).index_sorted
+
+
+def percentile(values, percent):
+	if not values:
+		return 0
+
+	values = sorted(values)
+	return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+def run(font_path, text, config, chunk, repeat):
+	'''按 chunk 个字符一组调用 get_characters()，返回每字符耗时（微秒）和 I/O 统计
+
+	使用索引缓存的配置先完整运行一遍生成 .idx 附属文件，测量的是重启后的情况，结束后删除生成的附属文件'''
+	sidecar = os.path.splitext(font_path)[0] + '.idx'
+	existed = os.path.exists(sidecar)
+	if config.get('index_cache'):
+		with FontLib(font_path, **config) as font:
+			font.get_characters(text)
+
+	stats = FontLibStats()
+	tracemalloc.start()
+
+	font = FontLib(font_path, stats=stats, **config)
+	init_seeks, init_bytes = stats.seeks, stats.bytes_read
+	stats.reset()
+	latencies = []
+	chars = 0
+
+	for _ in range(repeat):
+		for start in range(0, len(text), chunk):
+			part = text[start:start + chunk]
+			count = len(set(part))
+
+			start_time = time.perf_counter_ns()
+			font.get_characters(part)
+			latencies.append((time.perf_counter_ns() - start_time) / 1000 / count)
+			chars += count
+
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	font.close()
+
+	if config.get('index_cache') and not existed and os.path.exists(sidecar):
+		os.remove(sidecar)
+
+	counters = stats.snapshot()
+	counters['chars'] = chars
+	counters['peak'] = peak
+	counters['init_seeks'] = init_seeks
+	counters['init_bytes'] = init_bytes
+	return latencies, counters
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark FontLib lookups on desktop with synthetic fonts')
+	parser.add_argument('--glyphs', type=int, default=7614, help='indexed characters in the synthetic font, default: 7614')
+	parser.add_argument('--size', default='16x16', help='character size WxH, default: 16x16')
+	parser.add_argument('--version', type=int, choices=[1, 2], default=1, help='font file version, default: 1')
+	parser.add_argument('--sort', action='store_true', help='sort version 1 index table')
+	parser.add_argument('--compress', action='store_true', help='also benchmark a run-length encoded copy of the synthetic font, requires --version 2')
+	parser.add_argument('--font', help='benchmark an existing font file instead of a synthetic one')
+	parser.add_argument('--corpus', default='chars,chars2,chars3', help='main.py variables to use, default: chars,chars2,chars3')
+	parser.add_argument('--config', default=','.join(CONFIGS), help='FontLib configurations, default: {}'.format(','.join(CONFIGS)))
+	parser.add_argument('--chunk', type=int, default=32, help='characters per get_characters() call, default: 32')
+	parser.add_argument('--repeat', type=int, default=1, help='passes over each text, default: 1')
+	parser.add_argument('--seed', type=int, default=0, help='random seed of the synthetic font, default: 0')
+	args = parser.parse_args()
+
+	corpora = load_corpora()
+	CONFIGS['hot']['hot_chars'] = rank_characters(''.join(corpora.values()))
+	names = args.corpus.split(',')
+	for name in names:
+		if name not in corpora:
+			parser.error('unknown corpus: {}'.format(name))
+
+	for name in args.config.split(','):
+		if name not in CONFIGS:
+			parser.error('unknown config: {}'.format(name))
+
+	if args.compress and args.version == 1:
+		parser.error('--compress requires --version 2')
+
+	configs = args.config.split(',')
+	paged = any(CONFIGS[config].get('page_size') for config in configs)
+
+	with tempfile.TemporaryDirectory() as temp_dir:
+		fonts = [('file', args.font)]
+		sorted_fonts = {}
+		if args.font is None:
+			width, height = (int(value) for value in args.size.lower().split('x'))
+			fonts = [('raw', os.path.join(temp_dir, 'bench.bin'))]
+			if args.compress:
+				fonts.append(('rle', os.path.join(temp_dir, 'bench_rle.bin')))
+
+			for kind, font_path in fonts:
+				size = make_font(font_path, args.glyphs, width, height, args.version, args.sort, ''.join(corpora.values()), args.seed, kind == 'rle')
+				print('synthetic font ({}): {} indexed chars, {}x{}, version {}{}, {} bytes'.format(
+					kind, args.glyphs, width, height, args.version, ', sorted' if args.sort else '', size))
+
+			# page_size 只对排序的索引表起作用，为分页配置另外生成一份排序的字库
+			if paged and args.version == 1 and not args.sort:
+				sorted_fonts['raw'] = os.path.join(temp_dir, 'bench_sorted.bin')
+				size = make_font(sorted_fonts['raw'], args.glyphs, width, height, args.version, True, ''.join(corpora.values()), args.seed)
+				print('synthetic font (sort): {} indexed chars, {}x{}, version {}, sorted, {} bytes, used by page_size configs'.format(
+					args.glyphs, width, height, args.version, size))
+
+		print('{:<8} {:<5} {:<10} {:>6} {:>8} {:>8} {:>8} {:>9} {:>6} {:>7} {:>10} {:>7} {:>6} {:>9} {:>10} {:>10}'.format(
+			'corpus', 'font', 'config', 'chars', 'p50 us', 'p90 us', 'p99 us', 'max us', 'opens', 'seeks', 'bytes', 'index', 'hits', 'peak', 'init seeks', 'init bytes'))
+
+		for name in names:
+			for config in configs:
+				for kind, font_path in fonts:
+					if CONFIGS[config].get('page_size') and not index_sorted(font_path):
+						if kind not in sorted_fonts:
+							print('{:<8} {:<5} {:<10} n/a, page_size requires a sorted index table'.format(name, kind, config))
+							continue
+
+						kind, font_path = 'sort', sorted_fonts[kind]
+
+					latencies, counters = run(font_path, corpora[name], CONFIGS[config], args.chunk, args.repeat)
+					print('{:<8} {:<5} {:<10} {:>6} {:>8.1f} {:>8.1f} {:>8.1f} {:>9.1f} {:>6} {:>7} {:>10} {:>7} {:>6} {:>9} {:>10} {:>10}'.format(
+						name, kind, config, counters['chars'],
+						percentile(latencies, 50), percentile(latencies, 90), percentile(latencies, 99), max(latencies),
+						counters['opens'], counters['seeks'], counters['bytes_read'], counters['index_reads'], counters['cache_hits'], counters['peak'], counters['init_seeks'], counters['init_bytes']))
+
+
+if __name__ == '__main__':
+	main()
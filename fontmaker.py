@@ -0,0 +1,890 @@
+"""
+The MIT License (MIT)
+Copyright © 2021 Walkline Wang (https://walkline.wang)
+Gitee: https://gitee.com/walkline/micropython-new-fontlib
+"""
+import os
+import ast
+import gzip
+import math
+import struct
+import binascii
+import argparse
+import unicodedata
+from collections import Counter
+from fontlib import FontLib, FontLibHeader, FontLibHeaderException
+
+SEGMENT_MIN_RUN = FontLib.MIN_RUN
+HOT_SIZE = 256
+
+class FontMakerException(Exception):
+	pass
+
+
+class BitmapFont(object):
+	'''点阵字体，glyphs 为 {unicode: rows}，每行点阵用一个整数表示，最高位为最左侧像素'''
+	def __init__(self, width, height):
+		self.width = width
+		self.height = height
+		self.glyphs = {}
+
+	def put(self, unicode, pixels, x, y):
+		'''把点阵放到字符的 (x, y) 位置，pixels 为 [[0, 1, ...], ...]，超出字符范围的部分会被裁剪'''
+		rows = self.glyphs.setdefault(unicode, [0] * self.height)
+
+		for row, line in enumerate(pixels, start=y):
+			if not 0 <= row < self.height:
+				continue
+
+			for col, pixel in enumerate(line, start=x):
+				if pixel and 0 <= col < self.width:
+					rows[row] |= 1 << (self.width - 1 - col)
+
+	def proportional(self, spacing=1):
+		'''把半角字符的点阵左对齐，返回 {unicode: 字符宽度}
+
+		半角字符的宽度为点阵宽度加上 spacing，空白字符为 width 的一半，全角字符（East Asian Width 为 W 或 F）保持 width'''
+		advances = {}
+		mask = (1 << self.width) - 1
+
+		for unicode, rows in self.glyphs.items():
+			if unicodedata.east_asian_width(chr(unicode)) in ('W', 'F'):
+				advances[unicode] = self.width
+				continue
+
+			ink = 0
+			for row in rows:
+				ink |= row
+
+			if not ink:
+				advances[unicode] = self.width // 2
+				continue
+
+			left = self.width - ink.bit_length()
+			right = (ink & -ink).bit_length() - 1
+			self.glyphs[unicode] = [row << left & mask for row in rows]
+			advances[unicode] = min(self.width, self.width - left - right + spacing)
+
+		return advances
+
+	@staticmethod
+	def load(path, width=None, height=None):
+		'''根据路径自动选择读取方式，支持 BDF、PCF 和 PBM 文件夹'''
+		if os.path.isdir(path):
+			return BitmapFont.load_pbm_dir(path, width, height)
+
+		lower = path.lower()
+		if lower.endswith('.bdf'):
+			return BitmapFont.load_bdf(path, width, height)
+		elif lower.endswith(('.pcf', '.pcf.gz')):
+			return BitmapFont.load_pcf(path, width, height)
+
+		raise FontMakerException('Unsupported font source: {}'.format(path))
+
+	@staticmethod
+	def load_bdf(path, width=None, height=None):
+		with open(path, 'r', encoding='latin-1') as bdf_file:
+			lines = bdf_file.read().splitlines()
+
+		properties = {}
+		glyph_list = []
+		glyph = None
+
+		for line in lines:
+			fields = line.split()
+			if not fields:
+				continue
+
+			keyword = fields[0]
+			if glyph is not None and glyph.get('bitmap') is not None:
+				if keyword == 'ENDCHAR':
+					glyph_list.append(glyph)
+					glyph = None
+				else:
+					glyph['bitmap'].append(keyword)
+			elif keyword == 'STARTCHAR':
+				glyph = {'encoding': -1, 'bbx': None, 'bitmap': None}
+			elif glyph is not None:
+				if keyword == 'ENCODING':
+					glyph['encoding'] = int(fields[-1])
+				elif keyword == 'BBX':
+					glyph['bbx'] = [int(value) for value in fields[1:5]]
+				elif keyword == 'BITMAP':
+					glyph['bitmap'] = []
+			elif keyword in ('FONTBOUNDINGBOX', 'FONT_ASCENT', 'FONT_DESCENT'):
+				properties[keyword] = [int(value) for value in fields[1:]]
+
+		if 'FONTBOUNDINGBOX' not in properties:
+			raise FontMakerException('Invalid BDF file: {}'.format(path))
+
+		bound_width, bound_height, bound_x, bound_y = properties['FONTBOUNDINGBOX']
+		ascent = properties.get('FONT_ASCENT', [bound_height + bound_y])[0]
+		descent = properties.get('FONT_DESCENT', [-bound_y])[0]
+
+		font = BitmapFont(width or bound_width, height or ascent + descent)
+		baseline = ascent + (font.height - ascent - descent) // 2
+		origin_x = -min(bound_x, 0)
+
+		for glyph in glyph_list:
+			if glyph['encoding'] < 0 or glyph['bbx'] is None:
+				continue
+
+			glyph_width, glyph_height, glyph_x, glyph_y = glyph['bbx']
+			pixels = []
+			for row in glyph['bitmap'][:glyph_height]:
+				bits = len(row) * 4
+				value = int(row, 16)
+				pixels.append([value >> (bits - 1 - col) & 1 for col in range(glyph_width)])
+
+			font.glyphs[glyph['encoding']] = [0] * font.height
+			font.put(glyph['encoding'], pixels, origin_x + glyph_x, baseline - glyph_y - glyph_height)
+
+		return font
+
+	@staticmethod
+	def load_pcf(path, width=None, height=None):
+		PCF_ACCELERATORS = 1 << 1
+		PCF_METRICS = 1 << 2
+		PCF_BITMAPS = 1 << 3
+		PCF_BDF_ENCODINGS = 1 << 5
+		PCF_BDF_ACCELERATORS = 1 << 8
+		PCF_COMPRESSED_METRICS = 0x100
+
+		opener = gzip.open if path.lower().endswith('.gz') else open
+		with opener(path, 'rb') as pcf_file:
+			data = pcf_file.read()
+
+		if data[:4] != b'\x01fcp':
+			raise FontMakerException('Invalid PCF file: {}'.format(path))
+
+		tables = {}
+		for index in range(struct.unpack_from('<I', data, 4)[0]):
+			table_type, table_format, _, table_offset = struct.unpack_from('<IIII', data, 8 + index * 16)
+			tables[table_type] = (table_format, table_offset)
+
+		def table(table_type):
+			if table_type not in tables:
+				return None, None, None
+
+			table_format, table_offset = tables[table_type]
+			table_format = struct.unpack_from('<I', data, table_offset)[0]
+			return table_format, table_offset + 4, '>' if table_format & (1 << 2) else '<'
+
+		for table_type in (PCF_METRICS, PCF_BITMAPS, PCF_BDF_ENCODINGS):
+			if table_type not in tables:
+				raise FontMakerException('Invalid PCF file: {}'.format(path))
+
+		table_format, offset, order = table(PCF_METRICS)
+		metrics = []
+		if table_format & PCF_COMPRESSED_METRICS:
+			for index in range(struct.unpack_from(order + 'H', data, offset)[0]):
+				metrics.append([value - 0x80 for value in struct.unpack_from('5B', data, offset + 2 + index * 5)])
+		else:
+			for index in range(struct.unpack_from(order + 'I', data, offset)[0]):
+				metrics.append(list(struct.unpack_from(order + '5h', data, offset + 4 + index * 12)))
+
+		table_format, offset, order = table(PCF_BITMAPS)
+		count = struct.unpack_from(order + 'I', data, offset)[0]
+		bitmap_offsets = struct.unpack_from(order + '{}I'.format(count), data, offset + 4)
+		bitmap_data = offset + 4 + count * 4 + 16
+		glyph_pad = 1 << (table_format & 3)
+		scan_unit = 1 << (table_format >> 4 & 3)
+		bit_msb = bool(table_format & (1 << 3))
+		byte_msb = bool(table_format & (1 << 2))
+
+		table_format, offset, order = table(PCF_BDF_ENCODINGS)
+		min_byte2, max_byte2, min_byte1, max_byte1, _ = struct.unpack_from(order + '5h', data, offset)
+		columns = max_byte2 - min_byte2 + 1
+		rows = max_byte1 - min_byte1 + 1
+		glyph_indices = struct.unpack_from(order + '{}H'.format(columns * rows), data, offset + 10)
+
+		ascent = max(metric[3] for metric in metrics)
+		descent = max(metric[4] for metric in metrics)
+		for table_type in (PCF_BDF_ACCELERATORS, PCF_ACCELERATORS):
+			if table_type in tables:
+				table_format, offset, order = table(table_type)
+				ascent, descent = struct.unpack_from(order + '2i', data, offset + 8)
+				break
+
+		bound_width = max(max(metric[1], metric[2]) - min(metric[0], 0) for metric in metrics)
+		font = BitmapFont(width or bound_width, height or ascent + descent)
+		baseline = ascent + (font.height - ascent - descent) // 2
+		origin_x = -min(min(metric[0] for metric in metrics), 0)
+
+		for position, glyph_index in enumerate(glyph_indices):
+			if glyph_index == 0xffff or glyph_index >= len(metrics):
+				continue
+
+			unicode = (min_byte1 + position // columns) << 8 | (min_byte2 + position % columns)
+			left, right, _, glyph_ascent, glyph_descent = metrics[glyph_index]
+			glyph_width = right - left
+			glyph_height = glyph_ascent + glyph_descent
+			row_bytes = (glyph_width + glyph_pad * 8 - 1) // (glyph_pad * 8) * glyph_pad
+			start = bitmap_data + bitmap_offsets[glyph_index]
+
+			pixels = []
+			for row in range(glyph_height):
+				line = bytearray(data[start + row * row_bytes:start + (row + 1) * row_bytes])
+
+				if scan_unit > 1 and bit_msb != byte_msb:
+					for unit in range(0, len(line), scan_unit):
+						line[unit:unit + scan_unit] = line[unit:unit + scan_unit][::-1]
+
+				value = 0
+				for byte in line:
+					if not bit_msb:
+						byte = int('{:08b}'.format(byte)[::-1], 2)
+					value = value << 8 | byte
+
+				bits = len(line) * 8
+				pixels.append([value >> (bits - 1 - col) & 1 for col in range(glyph_width)])
+
+			font.glyphs[unicode] = [0] * font.height
+			font.put(unicode, pixels, origin_x + left, baseline - glyph_ascent)
+
+		return font
+
+	@staticmethod
+	def load_pbm_dir(path, width=None, height=None):
+		'''读取文件夹中的 PBM 文件，文件名为字符的 Unicode 值，如 4e2d.pbm、U+4E2D.pbm、0x4e2d.pbm'''
+		images = {}
+
+		for filename in sorted(os.listdir(path)):
+			name, ext = os.path.splitext(filename)
+			if ext.lower() != '.pbm':
+				continue
+
+			name = name.lower()
+			for prefix in ('u+', '0x', 'u'):
+				if name.startswith(prefix):
+					name = name[len(prefix):]
+					break
+
+			try:
+				unicode = int(name, 16)
+			except ValueError:
+				continue
+
+			images[unicode] = read_pbm(os.path.join(path, filename))
+
+		if not images:
+			raise FontMakerException('No PBM file found in {}'.format(path))
+
+		font = BitmapFont(
+			width or max(len(pixels[0]) if pixels else 0 for pixels in images.values()),
+			height or max(len(pixels) for pixels in images.values())
+		)
+
+		for unicode, pixels in images.items():
+			font.glyphs[unicode] = [0] * font.height
+			font.put(unicode, pixels, 0, 0)
+
+		return font
+
+
+def read_pbm(path):
+	'''读取 P1 或 P4 格式的 PBM 文件，返回 [[0, 1, ...], ...]'''
+	with open(path, 'rb') as pbm_file:
+		data = pbm_file.read()
+
+	fields = []
+	position = 0
+	while len(fields) < 3:
+		while position < len(data) and data[position:position + 1].isspace():
+			position += 1
+
+		if data[position:position + 1] == b'#':
+			while position < len(data) and data[position:position + 1] not in b'\r\n':
+				position += 1
+			continue
+
+		start = position
+		while position < len(data) and not data[position:position + 1].isspace():
+			position += 1
+		fields.append(data[start:position])
+
+	magic, width, height = fields[0], int(fields[1]), int(fields[2])
+
+	if magic == b'P4':
+		position += 1
+		row_bytes = (width + 7) // 8
+		pixels = []
+		for row in range(height):
+			line = data[position + row * row_bytes:position + (row + 1) * row_bytes]
+			pixels.append([line[col // 8] >> (7 - col % 8) & 1 for col in range(width)])
+		return pixels
+	elif magic == b'P1':
+		values = [int(char) for char in data[position:].decode('ascii') if char in '01']
+		return [values[row * width:(row + 1) * width] for row in range(height)]
+
+	raise FontMakerException('Unsupported PBM file: {}'.format(path))
+
+
+def encode_glyph(rows, width, height, scan_mode, byte_order):
+	'''把点阵编码为字库中的字符数据，与 framebuf 的 MONO_HLSB、MONO_HMSB 和 MONO_VLSB 格式对应'''
+	data_size = ((width - 1) // 8 + 1) * height
+
+	if scan_mode == FontLibHeader.SCAN_MODE_HORIZONTAL:
+		bytes_per_row = (width - 1) // 8 + 1
+		data = bytearray(data_size)
+
+		for y, row in enumerate(rows):
+			for x in range(width):
+				if row >> (width - 1 - x) & 1:
+					if byte_order == FontLibHeader.BYTE_ORDER_MSB:
+						data[y * bytes_per_row + x // 8] |= 1 << (x % 8)
+					else:
+						data[y * bytes_per_row + x // 8] |= 0x80 >> (x % 8)
+
+		return bytes(data)
+
+	if byte_order != FontLibHeader.BYTE_ORDER_LSB:
+		raise FontMakerException('Vertical scan mode only supports LSB byte order')
+
+	if ((height - 1) // 8 + 1) * width != data_size:
+		raise FontMakerException('Vertical scan mode requires (width + 7) // 8 * height == (height + 7) // 8 * width')
+
+	data = bytearray(data_size)
+	for y, row in enumerate(rows):
+		for x in range(width):
+			if row >> (width - 1 - x) & 1:
+				data[y // 8 * width + x] |= 1 << (y % 8)
+
+	return bytes(data)
+
+
+def pack_glyph(data):
+	'''游程编码字符数据，连续 2 个以上的 0 编码为 0x80 | (数量 - 1)，其余字节每 128 个一组编码为 (数量 - 1) 加原始字节'''
+	packed = bytearray()
+	literal = bytearray()
+	index = 0
+
+	def flush():
+		for start in range(0, len(literal), 128):
+			chunk = literal[start:start + 128]
+			packed.append(len(chunk) - 1)
+			packed.extend(chunk)
+		literal.clear()
+
+	while index < len(data):
+		end = index
+		while end < len(data) and data[end] == 0 and end - index < 128:
+			end += 1
+
+		if end - index >= 2:
+			flush()
+			packed.append(0x80 | (end - index - 1))
+			index = end
+		else:
+			literal.append(data[index])
+			index += 1
+
+	flush()
+	return bytes(packed)
+
+
+def unpack_glyph(packed, data_size):
+	'''解压 pack_glyph() 编码的字符数据'''
+	data = bytearray()
+	index = 0
+
+	while index < len(packed):
+		count = packed[index]
+		index += 1
+
+		if count & 0x80:
+			data.extend(bytes((count & 0x7f) + 1))
+		else:
+			data.extend(packed[index:index + count + 1])
+			index += count + 1
+
+	if len(data) != data_size:
+		raise FontMakerException('Invalid compressed glyph')
+
+	return bytes(data)
+
+
+def pack_blocks(block_list, address):
+	'''把 [(tag, 数据), ...] 打包为扩展数据块和数据块列表，address 为第一个数据块的地址，返回 (数据, 数据块列表地址)'''
+	data = b''
+	table = struct.pack('<H', len(block_list))
+
+	for tag, block in block_list:
+		table += struct.pack('<4sII', tag, address + len(data), len(block))
+		data += block
+
+	return data + table, address + len(data)
+
+
+def make_coverage(unicode_list):
+	'''生成覆盖位图，第 n 位为 1 表示收录了 Unicode 编码为 n 的字符，ASCII 字符总是收录的'''
+	coverage = bytearray(FontLib.COVERAGE_SIZE)
+
+	for unicode in list(range(FontLib.ASCII_START, FontLib.ASCII_END + 1)) + list(unicode_list):
+		coverage[unicode >> 3] |= 1 << (unicode & 7)
+
+	return bytes(coverage)
+
+
+def find_runs(unicode_list):
+	'''把已排序的 unicode_list 分为编码连续的若干组，返回 [[start, end], ...]'''
+	runs = []
+	for unicode in unicode_list:
+		if runs and unicode == runs[-1][1] + 1:
+			runs[-1][1] = unicode
+		else:
+			runs.append([unicode, unicode])
+
+	return runs
+
+
+def make_segments(unicode_list, first_id, min_run=SEGMENT_MIN_RUN):
+	'''把已排序的 unicode_list 分为连续段和稀疏段，生成分段索引数据块，first_id 为第一个字符的序号
+
+	连续 min_run 个以上的字符组成一个连续段，查找时直接计算，其余字符合并为稀疏段，查找时在键表中二分查找'''
+	runs = find_runs(unicode_list)
+	segments = []
+	sparse = []
+
+	for start, end in runs:
+		if end - start + 1 < min_run:
+			sparse.extend(range(start, end + 1))
+			continue
+
+		if sparse:
+			segments.append((sparse[0], sparse[-1], sparse))
+			sparse = []
+
+		segments.append((start, end, None))
+
+	if sparse:
+		segments.append((sparse[0], sparse[-1], sparse))
+
+	table = struct.pack('<H', len(segments))
+	keys_data = b''
+	keys_offset = 2 + len(segments) * 20
+
+	for start, end, keys in segments:
+		count = end - start + 1 if keys is None else len(keys)
+		table += struct.pack('<IIIII', start, end, first_id, count, 0 if keys is None else keys_offset + len(keys_data))
+		first_id += count
+
+		if keys is not None:
+			keys_data += b''.join(struct.pack('<I', unicode) for unicode in keys)
+
+	return table + keys_data
+
+
+def read_segments(block):
+	'''按字符序号的顺序返回分段索引数据块中的所有字符'''
+	unicode_list = []
+	count = struct.unpack_from('<H', block, 0)[0]
+
+	for index in range(count):
+		start, end, first_id, length, keys = struct.unpack_from('<IIIII', block, 2 + index * 20)
+		if keys == 0:
+			unicode_list += range(start, end + 1)
+		else:
+			unicode_list += struct.unpack_from('<{}I'.format(length), block, keys)
+
+	return unicode_list
+
+
+def rank_characters(text, count=HOT_SIZE):
+	'''按出现次数从多到少返回 text 中最常用的 count 个非 ASCII 字符，次数相同时先出现的字符在前'''
+	counter = Counter(char for char in text if ord(char) > FontLib.ASCII_END and char not in '\r\n\t')
+	return ''.join(char for char, _ in counter.most_common(count))
+
+
+def make_hot_block(hot, unicode_list):
+	'''生成常用字表数据块，hot 为按使用频率排序的字符，unicode_list 为按字符序号排列的所有字符'''
+	glyph_ids = {unicode: glyph_id for glyph_id, unicode in enumerate(unicode_list)}
+	hot_list = [ord(char) for char in hot if ord(char) > FontLib.ASCII_END and ord(char) in glyph_ids]
+
+	return struct.pack('<H', len(hot_list)) +\
+		b''.join(struct.pack('<I', unicode) for unicode in hot_list) +\
+		b''.join(struct.pack('<H', glyph_ids[unicode]) for unicode in hot_list)
+
+
+def read_hot(block):
+	'''按使用频率的顺序返回常用字表数据块中的字符'''
+	count = struct.unpack_from('<H', block, 0)[0]
+	return ''.join(chr(unicode) for unicode in struct.unpack_from('<{}I'.format(count), block, 2))
+
+
+def build_font_data(glyph_dict, width, height, scan_mode, byte_order, version=1, sort=False, advances=None, compress=False, coverage=False, segmented=False, hot=None):
+	'''生成字库文件数据，glyph_dict 为 {unicode: 字符数据}
+
+	version 1 生成与 FontMaker 相同的 FMUX 字库，sort 为 True 时索引表按 Unicode 值排序
+	version 2 生成 FMUZ 字库，索引表总是排序的，advances 为 {unicode: 字符宽度} 时生成字符宽度表，未指定的字符宽度为 width，
+	compress 为 True 时压缩字符数据并生成字符偏移表，coverage 为 True 时生成覆盖位图，
+	编码连续的字符和 Unicode 值大于 0xffef 的字符保存在分段索引中，segmented 为 True 时所有非 ASCII 字符都保存在分段索引中，
+	hot 为按使用频率排序的常用字符（参见 rank_characters()），用于生成常用字表
+	'''
+	data_size = ((width - 1) // 8 + 1) * height
+	blank = bytes(data_size)
+
+	for unicode, data in glyph_dict.items():
+		if len(data) != data_size:
+			raise FontMakerException('Invalid data size of U+{:04X}'.format(unicode))
+
+	index_list = [unicode for unicode in glyph_dict if FontLib.GB2312_START <= unicode <= FontLib.GB2312_END and not segmented]
+	if sort or version > 1:
+		index_list.sort()
+
+	if version > 1:
+		index_list = [unicode for start, end in find_runs(index_list) if end - start + 1 < SEGMENT_MIN_RUN for unicode in range(start, end + 1)]
+
+	index_set = set(index_list)
+	segment_list = sorted(unicode for unicode in glyph_dict if unicode > FontLib.ASCII_END and unicode not in index_set)
+
+	if len(index_list) + len(segment_list) + 96 > 0xffff:
+		raise FontMakerException('Too many characters')
+
+	ascii_data = b''.join(glyph_dict.get(unicode, blank) for unicode in range(FontLib.ASCII_START, FontLib.ASCII_END + 1))
+	index_data = b''.join(struct.pack('<H', unicode) for unicode in index_list)
+	glyph_data = b''.join(glyph_dict[unicode] for unicode in index_list + segment_list)
+	flags = FontLibHeader.FLAG_INDEX_SORTED if sort or version > 1 else 0
+
+	if version == 1:
+		if advances:
+			raise FontMakerException('Advance table requires version 2')
+		if compress:
+			raise FontMakerException('Compressed glyphs require version 2')
+		if coverage:
+			raise FontMakerException('Coverage bitmap requires version 2')
+		if segment_list:
+			raise FontMakerException('Segmented index requires version 2')
+		if hot:
+			raise FontMakerException('Hot character table requires version 2')
+
+		ascii_start = FontLibHeader.LENGTH + len(index_data)
+		index_data += bytes(-ascii_start % 4)
+		ascii_start += -ascii_start % 4
+		gb2312_start = ascii_start + len(ascii_data)
+		file_size = gb2312_start + len(glyph_data)
+
+		header = struct.pack('<4sIBBHBBBIIH',
+			b'FMUX', file_size, width, height, len(index_list) + 96,
+			1, scan_mode, byte_order, ascii_start, gb2312_start, flags)
+
+		return header + index_data + ascii_data + glyph_data
+
+	ascii_start = FontLibHeader.LENGTH_V2 + len(index_data)
+	gb2312_start = ascii_start + len(ascii_data)
+	unicode_list = list(range(FontLib.ASCII_START, FontLib.ASCII_END + 1)) + index_list + segment_list
+	block_list = []
+	block_table_address = 0
+
+	if compress:
+		flags |= FontLibHeader.FLAG_GLYPH_RLE
+		offsets = [ascii_start]
+		packed_list = []
+
+		for unicode in unicode_list:
+			packed_list.append(pack_glyph(glyph_dict.get(unicode, blank)))
+			offsets.append(offsets[-1] + len(packed_list[-1]))
+
+		ascii_data = b''.join(packed_list)
+		glyph_data = b''
+		block_list.append((FontLibHeader.BLOCK_GLYPH_OFFSETS, b''.join(struct.pack('<I', offset) for offset in offsets)))
+
+	body = index_data + ascii_data + glyph_data
+
+	if advances:
+		block_list.append((FontLibHeader.BLOCK_ADVANCES, bytes(min(advances.get(unicode, width), 0xff) for unicode in unicode_list)))
+
+	if coverage:
+		block_list.append((FontLibHeader.BLOCK_COVERAGE, make_coverage(index_list + [unicode for unicode in segment_list if unicode <= FontLib.GB2312_END])))
+
+	if segment_list:
+		block_list.append((FontLibHeader.BLOCK_SEGMENTS, make_segments(segment_list, 96 + len(index_list))))
+
+	if hot:
+		block_list.append((FontLibHeader.BLOCK_HOT, make_hot_block(hot, unicode_list)))
+
+	if block_list:
+		block_data, block_table_address = pack_blocks(block_list, FontLibHeader.LENGTH_V2 + len(body))
+		body += block_data
+
+	file_size = FontLibHeader.LENGTH_V2 + len(body)
+
+	# 分段索引中有 0xffef 以内的字符时只有 version 3 的读取程序能找到，写入 3 让旧的读取程序拒绝打开
+	file_version = 3 if segment_list and segment_list[0] <= FontLib.GB2312_END else 2
+
+	header = struct.pack('<4sIBBHBBBIIHBHII',
+		b'FMUZ', file_size, width, height, len(index_list) + len(segment_list) + 96,
+		1, scan_mode, byte_order, ascii_start, gb2312_start, flags,
+		file_version, FontLibHeader.LENGTH_V2, block_table_address, binascii.crc32(body) & 0xffffffff)
+
+	return header + body
+
+
+def build_font(font, scan_mode=FontLibHeader.SCAN_MODE_VERTICAL, byte_order=FontLibHeader.BYTE_ORDER_LSB, version=1, sort=False, charset=None, advances=None, compress=False, coverage=False, segmented=False, hot=None):
+	'''把 BitmapFont 编译为字库文件数据，charset 用于指定需要收录的字符，advances 为 BitmapFont.proportional() 的返回值
+
+	version 1 不能收录 Unicode 值大于 0xffef 的字符，这些字符会被跳过'''
+	glyph_dict = {}
+	skipped = []
+
+	for unicode, rows in font.glyphs.items():
+		if charset is not None and unicode not in charset:
+			continue
+
+		if FontLib.ASCII_START <= unicode <= FontLib.GB2312_END or (version > 1 and unicode > FontLib.GB2312_END):
+			glyph_dict[unicode] = encode_glyph(rows, font.width, font.height, scan_mode, byte_order)
+		else:
+			skipped.append(unicode)
+
+	return build_font_data(glyph_dict, font.width, font.height, scan_mode, byte_order, version, sort, advances, compress, coverage, segmented, hot), skipped
+
+
+def load_font_data(path):
+	'''读取字库文件，返回 (FontLibHeader, {unicode: 字符数据})，包含全部 ASCII 字符'''
+	with open(path, 'rb') as font_file:
+		data = font_file.read()
+
+	header_length = FontLibHeader.LENGTH_V2 if data[:4] == b'FMUZ' else FontLibHeader.LENGTH
+	header = FontLibHeader(data[:header_length])
+	data_size = header.data_size
+	glyph_dict = {}
+
+	blocks = load_blocks(path)[1]
+	unicode_list = list(range(FontLib.ASCII_START, FontLib.ASCII_END + 1))
+	unicode_list += [struct.unpack_from('<H', data, header.index_table_address + index * 2)[0] for index in range(header.index_count)]
+
+	if FontLibHeader.BLOCK_SEGMENTS in blocks:
+		unicode_list += read_segments(blocks[FontLibHeader.BLOCK_SEGMENTS])
+
+	if header.glyph_compressed:
+		if FontLibHeader.BLOCK_GLYPH_OFFSETS not in blocks:
+			raise FontMakerException('Missing glyph offset table')
+
+		offsets = blocks[FontLibHeader.BLOCK_GLYPH_OFFSETS]
+		for index, unicode in enumerate(unicode_list):
+			address, end = struct.unpack_from('<II', offsets, index * 4)
+			glyph_dict[unicode] = unpack_glyph(data[address:end], data_size)
+
+		return header, glyph_dict
+
+	for index, unicode in enumerate(unicode_list):
+		if index < 96:
+			address = header.ascii_start + index * data_size
+		else:
+			address = header.gb2312_start + (index - 96) * data_size
+
+		glyph_dict[unicode] = data[address:address + data_size]
+
+	return header, glyph_dict
+
+
+def load_blocks(path):
+	'''读取字库文件中的扩展数据块，返回 (FontLibHeader, {tag: 数据})，旧版字库没有扩展数据块'''
+	with open(path, 'rb') as font_file:
+		data = font_file.read()
+
+	header_length = FontLibHeader.LENGTH_V2 if data[:4] == b'FMUZ' else FontLibHeader.LENGTH
+	header = FontLibHeader(data[:header_length])
+	blocks = {}
+
+	if header.block_table_address:
+		count = struct.unpack_from('<H', data, header.block_table_address)[0]
+		for index in range(count):
+			tag, address, length = struct.unpack_from('<4sII', data, header.block_table_address + 2 + index * 12)
+			blocks[tag] = data[address:address + length]
+
+	return header, blocks
+
+
+def load_advances(path):
+	'''读取字库文件中的字符宽度表，返回 {unicode: 字符宽度}，没有字符宽度表时返回 None'''
+	header, blocks = load_blocks(path)
+	if FontLibHeader.BLOCK_ADVANCES not in blocks:
+		return None
+
+	with open(path, 'rb') as font_file:
+		font_file.seek(header.index_table_address)
+		index_data = font_file.read(header.index_count * 2)
+
+	unicode_list = list(range(FontLib.ASCII_START, FontLib.ASCII_END + 1))
+	unicode_list += [struct.unpack_from('<H', index_data, index * 2)[0] for index in range(header.index_count)]
+
+	if FontLibHeader.BLOCK_SEGMENTS in blocks:
+		unicode_list += read_segments(blocks[FontLibHeader.BLOCK_SEGMENTS])
+
+	return dict(zip(unicode_list, blocks[FontLibHeader.BLOCK_ADVANCES]))
+
+
+def read_corpus(path_list):
+	'''读取语料文件，.py 文件只读取模块级别的字符串变量，如 main.py 中的 chars、chars2、chars3'''
+	text = []
+
+	for path in path_list:
+		with open(path, 'r', encoding='utf-8') as corpus_file:
+			content = corpus_file.read()
+
+		if not path.endswith('.py'):
+			text.append(content)
+			continue
+
+		for node in ast.parse(content).body:
+			if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+				text.append(node.value.value)
+
+	return ''.join(text)
+
+
+def subset_font(path, text, version=None, sort=False, compress=None, coverage=None, segmented=None, hot=None):
+	'''从已有字库中提取 text 用到的字符生成新字库，保留 ASCII 字符和占位符 ?，返回 (字库文件数据, 统计信息)
+
+	compress、coverage 和 segmented 为 None 时与原字库相同，
+	hot 为常用字表的字符数量，从 text 中统计，为 None 时保留原字库常用字表中仍然收录的字符'''
+	header, glyph_dict = load_font_data(path)
+	blocks = load_blocks(path)[1]
+	advances = load_advances(path)
+	version = version or header.version
+	compress = header.glyph_compressed if compress is None else compress
+	if coverage is None:
+		coverage = FontLibHeader.BLOCK_COVERAGE in blocks
+	if segmented is None:
+		segmented = header.index_count == 0 and FontLibHeader.BLOCK_SEGMENTS in blocks
+	if hot is None:
+		hot = read_hot(blocks[FontLibHeader.BLOCK_HOT]) if FontLibHeader.BLOCK_HOT in blocks else ''
+	else:
+		hot = rank_characters(text, hot)
+
+	keep = set(range(FontLib.ASCII_START, FontLib.ASCII_END + 1))
+	missing = set()
+	for char in set(text):
+		unicode = ord(char)
+		if unicode in glyph_dict:
+			keep.add(unicode)
+		elif unicode >= FontLib.ASCII_START:
+			missing.add(unicode)
+
+	hot = ''.join(char for char in hot if ord(char) in keep)
+	if (advances or compress or coverage or hot) and version == 1:
+		raise FontMakerException('Advance table, compressed glyphs, coverage bitmap and hot character table require version 2')
+
+	subset_dict = {unicode: glyph_dict[unicode] for unicode in keep}
+	data = build_font_data(subset_dict, header.font_width, header.font_height, header.scan_mode, header.byte_order, version, sort or header.index_sorted, advances, compress, coverage, segmented, hot)
+
+	def probes(count):
+		return math.ceil(math.log2(count + 1)) if count else 0
+
+	index_count = len([unicode for unicode in subset_dict if unicode > FontLib.ASCII_END])
+	report = {
+		'source_size': header.file_size,
+		'output_size': len(data),
+		'source_index': header.index_count,
+		'output_index': index_count,
+		'missing': sorted(missing),
+		'source_scan_bytes': header.index_count * 2,
+		'output_scan_bytes': index_count * 2,
+		'source_probes': probes(header.index_count),
+		'output_probes': probes(index_count),
+	}
+
+	return data, report
+
+
+def build_command(parser, args):
+	font = BitmapFont.load(args.source, args.width, args.height)
+
+	charset = None
+	if args.charset:
+		with open(args.charset, 'r', encoding='utf-8') as charset_file:
+			charset = set(ord(char) for char in charset_file.read()) | {ord('?')}
+
+	scan_mode = FontLibHeader.SCAN_MODE_VERTICAL if args.scan_mode == 'vertical' else FontLibHeader.SCAN_MODE_HORIZONTAL
+	byte_order = FontLibHeader.BYTE_ORDER_MSB if args.byte_order == 'msb' else FontLibHeader.BYTE_ORDER_LSB
+
+	advances = font.proportional(args.spacing) if args.proportional else None
+	hot = rank_characters(read_corpus(args.hot_corpus), args.hot) if args.hot_corpus else None
+
+	try:
+		data, skipped = build_font(font, scan_mode, byte_order, args.version, args.sort, charset, advances, args.compress, args.coverage, args.segmented, hot)
+	except FontMakerException as e:
+		parser.error(e)
+
+	with open(args.output, 'wb') as font_file:
+		font_file.write(data)
+
+	if ord('?') not in font.glyphs:
+		print('warning: no glyph for "?", placeholder will be blank')
+	if skipped:
+		print('warning: skipped {} characters out of FontLib range{}'.format(len(skipped),
+			', use --version 2 to keep characters above U+FFEF' if max(skipped) > FontLib.GB2312_END else ''))
+
+	print('{}: {} characters, {} bytes'.format(args.output, len(font.glyphs) - len(skipped), len(data)))
+
+
+def subset_command(parser, args):
+	text = read_corpus(args.corpus) + (args.text or '')
+
+	try:
+		data, report = subset_font(args.source, text, args.version, args.sort, args.compress, args.coverage, args.segmented, args.hot)
+	except (FontMakerException, FontLibHeaderException) as e:
+		parser.error(e)
+
+	with open(args.output, 'wb') as font_file:
+		font_file.write(data)
+
+	print('\
+{}\n\
+    file size : {} -> {} bytes ({:.1%})\n\
+  index table : {} -> {} characters\n\
+  linear scan : {} -> {} bytes per lookup batch (worst case)\n\
+binary search : {} -> {} reads per character\n\
+      missing : {}'.format(
+		args.output,
+		report['source_size'], report['output_size'], report['output_size'] / report['source_size'],
+		report['source_index'], report['output_index'],
+		report['source_scan_bytes'], report['output_scan_bytes'],
+		report['source_probes'], report['output_probes'],
+		''.join(chr(unicode) for unicode in report['missing']) or '-'
+	))
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Build MicroPython FontLib font files on desktop')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+
+	build_parser = subparsers.add_parser('build', help='build a font file from BDF/PCF fonts or a directory of PBM images')
+	build_parser.add_argument('source', help='.bdf, .pcf, .pcf.gz file or a directory of <unicode>.pbm files')
+	build_parser.add_argument('-o', '--output', default='combined.bin', help='output font file, default: combined.bin')
+	build_parser.add_argument('--width', type=int, help='character width, default: from source')
+	build_parser.add_argument('--height', type=int, help='character height, default: from source')
+	build_parser.add_argument('--scan-mode', choices=['horizontal', 'vertical'], default='vertical', help='default: vertical')
+	build_parser.add_argument('--byte-order', choices=['lsb', 'msb'], default='lsb', help='default: lsb')
+	build_parser.add_argument('--version', type=int, choices=[1, 2], default=1, help='1: FMUX (default), 2: FMUZ')
+	build_parser.add_argument('--sort', action='store_true', help='sort version 1 index table for binary search')
+	build_parser.add_argument('--charset', help='text file with the characters to include')
+	build_parser.add_argument('--proportional', action='store_true', help='left align half width glyphs and add an advance width table, requires --version 2')
+	build_parser.add_argument('--spacing', type=int, default=1, help='pixels after each proportional glyph, default: 1')
+	build_parser.add_argument('--compress', action='store_true', help='run-length encode glyphs, requires --version 2')
+	build_parser.add_argument('--coverage', action='store_true', help='add a coverage bitmap for fast missing character checks, requires --version 2')
+	build_parser.add_argument('--segmented', action='store_true', help='put all non-ascii characters in the segmented index, requires --version 2')
+	build_parser.add_argument('--hot-corpus', nargs='+', help='text or .py files used to rank hot characters, requires --version 2')
+	build_parser.add_argument('--hot', type=int, default=HOT_SIZE, help='number of hot characters, default: {}'.format(HOT_SIZE))
+	build_parser.set_defaults(handler=build_command)
+
+	subset_parser = subparsers.add_parser('subset', help='keep only the characters used by a text corpus')
+	subset_parser.add_argument('source', help='existing font file')
+	subset_parser.add_argument('corpus', nargs='*', help='text files, or .py files whose module level strings are used')
+	subset_parser.add_argument('-o', '--output', default='subset.bin', help='output font file, default: subset.bin')
+	subset_parser.add_argument('-t', '--text', help='extra characters to include')
+	subset_parser.add_argument('--version', type=int, choices=[1, 2], help='output version, default: same as source')
+	subset_parser.add_argument('--sort', action='store_true', help='sort version 1 index table for binary search')
+	subset_parser.add_argument('--compress', action='store_true', default=None, help='run-length encode glyphs, default: same as source')
+	subset_parser.add_argument('--coverage', action='store_true', default=None, help='add a coverage bitmap, default: same as source')
+	subset_parser.add_argument('--segmented', action='store_true', default=None, help='put all non-ascii characters in the segmented index, default: same as source')
+	subset_parser.add_argument('--hot', type=int, help='number of hot characters ranked by the corpus, default: keep the hot characters of source')
+	subset_parser.set_defaults(handler=subset_command)
+
+	args = parser.parse_args()
+	args.handler(parser, args)
+
+
+if __name__ == '__main__':
+	main()
@@ -5,8 +5,21 @@ Gitee: https://gitee.com/walkline/micropython-new-fontlib
 """
 import gc
 import struct
+from array import array
 from micropython import const
-from framebuf import MONO_HLSB, MONO_HMSB, MONO_VLSB
+from framebuf import FrameBuffer, MONO_HLSB, MONO_HMSB, MONO_VLSB
+
+from utime import ticks_ms, ticks_diff
+
+try:
+	import _thread
+except ImportError:
+	_thread = None
+
+try:
+	import uasyncio as asyncio
+except ImportError:
+	asyncio = None
 
 
 class FontLibHeaderException(Exception):
@@ -21,9 +34,19 @@ class FontLibHeader(object):
 	SCAN_MODE_VERTICAL = BYTE_ORDER_MSB = const(1)
 	SCAN_MODE = {SCAN_MODE_HORIZONTAL: 'Horizontal', SCAN_MODE_VERTICAL: 'Vertical'}
 	BYTE_ORDER = {BYTE_ORDER_LSB: 'LSB', BYTE_ORDER_MSB: 'MSB'}
+	LENGTH_V2 = const(36)
+	VERSION = const(3)
+	FLAG_INDEX_SORTED = const(0x01)
+	FLAG_GLYPH_RLE = const(0x02)
+	FLAGS = const(0x03)
+	BLOCK_ADVANCES = b'ADVW'
+	BLOCK_GLYPH_OFFSETS = b'GOFF'
+	BLOCK_COVERAGE = b'COVR'
+	BLOCK_SEGMENTS = b'SIDX'
+	BLOCK_HOT = b'HOTB'
 
 	def __init__(self, header_data):
-		if len(header_data) != FontLibHeader.LENGTH:
+		if len(header_data) < FontLibHeader.LENGTH:
 			raise FontLibHeaderException('Invalid header length')
 
 		self.identify,\
@@ -36,37 +59,743 @@ class FontLibHeader(object):
 		self.byte_order,\
 		self.ascii_start,\
 		self.gb2312_start,\
-		_ = struct.unpack('<4sIBBHBBBII2s', header_data)
+		self.flags = struct.unpack('<4sIBBHBBBIIH', header_data[:FontLibHeader.LENGTH])
+
+		if self.identify in (b'FMUX', b'FMUY'):
+			if len(header_data) != FontLibHeader.LENGTH:
+				raise FontLibHeaderException('Invalid header length')
 
-		if self.identify not in (b'FMUX', b'FMUY'):
+			self.version = 1
+			self.header_length = FontLibHeader.LENGTH
+			self.block_table_address = 0
+			self.checksum = None
+		elif self.identify == b'FMUZ':
+			if len(header_data) != FontLibHeader.LENGTH_V2:
+				raise FontLibHeaderException('Invalid header length')
+
+			self.version,\
+			self.header_length,\
+			self.block_table_address,\
+			self.checksum = struct.unpack('<BHII', header_data[FontLibHeader.LENGTH:])
+
+			if not 2 <= self.version <= FontLibHeader.VERSION:
+				raise FontLibHeaderException('Unsupported font file version')
+
+			if self.flags & ~FontLibHeader.FLAGS:
+				raise FontLibHeaderException('Unsupported font file flags')
+		else:
 			raise FontLibHeaderException('Invalid font file')
 
 		self.data_size = ((self.font_width - 1) // 8 + 1) * self.font_height
 
+		if self.version == 1:
+			# 旧版文件头的标志位是保留字段，只有 fontmaker --sort 写入的值才表示索引表已排序
+			self.index_sorted = self.flags == FontLibHeader.FLAG_INDEX_SORTED
+		else:
+			self.index_sorted = bool(self.flags & FontLibHeader.FLAG_INDEX_SORTED)
+		self.glyph_compressed = self.version > 1 and bool(self.flags & FontLibHeader.FLAG_GLYPH_RLE)
+
 		if self.has_index_table:
-			self.index_table_address = FontLibHeader.LENGTH
+			self.index_table_address = self.header_length
+			if self.version == 1:
+				self.index_count = (self.file_size - self.gb2312_start) // self.data_size
+			else:
+				self.index_count = (self.ascii_start - self.header_length) // 2
 		else:
 			self.index_table_address = 0
+			self.index_count = 0
 		
 		self.format = MONO_VLSB
 		if self.scan_mode == FontLibHeader.SCAN_MODE_HORIZONTAL:
 			self.format = MONO_HMSB if self.byte_order == FontLibHeader.BYTE_ORDER_MSB else MONO_HLSB
 
 
+class GlyphCache(object):
+	'''字模缓存，按 LRU 策略淘汰，所有字模数据保存在一块预分配的 bytearray 中'''
+	def __init__(self, cache_size, data_size):
+		self.__data_size = data_size
+		self.__capacity = cache_size // data_size
+		self.__slab = memoryview(bytearray(self.__capacity * data_size))
+		self.__slot_dict = {}
+		self.__codes = array('I', [0] * self.__capacity)
+		self.__stamps = array('I', [0] * self.__capacity)
+		self.__prev = array('i', [-1] * self.__capacity)
+		self.__next = array('i', [-1] * self.__capacity)
+		self.__head = self.__tail = -1
+		self.__stamp = 0
+
+	def __unlink(self, slot):
+		prev = self.__prev[slot]
+		following = self.__next[slot]
+
+		if prev >= 0:
+			self.__next[prev] = following
+		else:
+			self.__head = following
+
+		if following >= 0:
+			self.__prev[following] = prev
+		else:
+			self.__tail = prev
+
+	def __push_front(self, slot):
+		self.__prev[slot] = -1
+		self.__next[slot] = self.__head
+
+		if self.__head >= 0:
+			self.__prev[self.__head] = slot
+		else:
+			self.__tail = slot
+
+		self.__head = slot
+		self.__stamps[slot] = self.__stamp
+
+	def __view(self, slot):
+		return self.__slab[slot * self.__data_size:(slot + 1) * self.__data_size]
+
+	def begin(self):
+		'''开始一次新的读取，本次读取用到的字模在读取结束前不会被淘汰'''
+		self.__stamp += 1
+
+	def get(self, unicode):
+		slot = self.__slot_dict.get(unicode)
+		if slot is None:
+			return None
+
+		if slot != self.__head:
+			self.__unlink(slot)
+			self.__push_front(slot)
+		else:
+			self.__stamps[slot] = self.__stamp
+
+		return self.__view(slot)
+
+	def put(self, unicode, buffer):
+		'''缓存字模数据并返回缓存中的 memoryview，缓存已满且无法淘汰时返回 None'''
+		if self.__capacity == 0:
+			return None
+
+		view = self.get(unicode)
+		if view is not None:
+			view[:] = buffer
+			return view
+
+		if len(self.__slot_dict) < self.__capacity:
+			slot = len(self.__slot_dict)
+		else:
+			slot = self.__tail
+			if self.__stamps[slot] == self.__stamp:
+				return None
+
+			del self.__slot_dict[self.__codes[slot]]
+			self.__unlink(slot)
+
+		view = self.__view(slot)
+		view[:] = buffer
+		self.__codes[slot] = unicode
+		self.__slot_dict[unicode] = slot
+		self.__push_front(slot)
+
+		return view
+
+	def clear(self):
+		self.__slot_dict = {}
+		self.__head = self.__tail = -1
+
+	@property
+	def capacity(self):
+		return self.__capacity
+
+	@property
+	def count(self):
+		return len(self.__slot_dict)
+
+
+class TextLayout(object):
+	'''文字排版，一次性计算出每一行在 UTF-8 编码文字中的起始位置和长度，之后可以按行或按页随机访问
+
+	每行最多 cols 个字符，每页 rows 行，换行符结束当前行，制表符和回车符不占位置
+	指定 advance 函数时，每个字符占用 advance(unicode) 的宽度，比如按像素计算宽度的比例字体'''
+	def __init__(self, text: str, cols, rows, advance=None):
+		self.__data = text.encode()
+		self.__cols = cols
+		self.__rows = rows
+		self.__starts = array('I')
+		self.__lengths = array('H')
+
+		start = offset = col = 0
+		for char in text:
+			unicode = ord(char)
+			size = 1 if unicode < 0x80 else 2 if unicode < 0x800 else 3 if unicode < 0x10000 else 4
+
+			if unicode == 10:
+				self.__starts.append(start)
+				self.__lengths.append(offset - start)
+				offset += size
+				start = offset
+				col = 0
+				continue
+
+			if unicode not in (9, 13):
+				step = 1 if advance is None else advance(unicode)
+
+				if col + step > cols and col > 0:
+					self.__starts.append(start)
+					self.__lengths.append(offset - start)
+					start = offset
+					col = 0
+
+				col += step
+
+			offset += size
+
+		if offset > start:
+			self.__starts.append(start)
+			self.__lengths.append(offset - start)
+
+	def line(self, index):
+		'''返回第 index 行的文字，不包含换行符'''
+		start = self.__starts[index]
+		return str(self.__data[start:start + self.__lengths[index]], 'utf-8')
+
+	def page(self, index):
+		'''返回第 index 页的所有行'''
+		first = index * self.__rows
+		return [self.line(line) for line in range(first, min(first + self.__rows, len(self.__starts)))]
+
+	def page_of(self, line):
+		'''返回第 line 行所在的页码'''
+		return line // self.__rows
+
+	def span(self, index):
+		'''返回第 index 行在 UTF-8 编码文字中的 (起始位置, 长度)'''
+		return self.__starts[index], self.__lengths[index]
+
+	@property
+	def cols(self):
+		return self.__cols
+
+	@property
+	def rows(self):
+		return self.__rows
+
+	@property
+	def lines(self):
+		return len(self.__starts)
+
+	@property
+	def pages(self):
+		return (len(self.__starts) + self.__rows - 1) // self.__rows
+
+
+class FontLibStats(object):
+	'''FontLib 读取统计，默认使用 utime.ticks_us 计时，也可以通过 ticks 和 ticks_diff 指定计时函数'''
+	def __init__(self, ticks=None, ticks_diff=None):
+		if ticks is None:
+			from utime import ticks_us, ticks_diff as diff
+			ticks = ticks_us
+			ticks_diff = diff
+		self.ticks = ticks
+		self.ticks_diff = ticks_diff or (lambda end, start: end - start)
+		self.reset()
+
+	def reset(self):
+		self.opens = 0
+		self.seeks = 0
+		self.bytes_read = 0
+		self.lookups = 0
+		self.index_reads = 0
+		self.max_index_reads = 0
+		self.placeholders = 0
+		self.hot_hits = 0
+		self.index_cache_hits = 0
+		self.cache_hits = 0
+		self.cache_misses = 0
+		self.index_time = 0
+		self.read_time = 0
+
+	def snapshot(self):
+		return {
+			'opens': self.opens,
+			'seeks': self.seeks,
+			'bytes_read': self.bytes_read,
+			'lookups': self.lookups,
+			'index_reads': self.index_reads,
+			'max_index_reads': self.max_index_reads,
+			'placeholders': self.placeholders,
+			'hot_hits': self.hot_hits,
+			'index_cache_hits': self.index_cache_hits,
+			'cache_hits': self.cache_hits,
+			'cache_misses': self.cache_misses,
+			'index_time': self.index_time,
+			'read_time': self.read_time
+		}
+
+	def lookup_done(self, index_reads, start_time):
+		'''记录一次查找，index_reads 为本次查找读取索引表的次数'''
+		self.lookups += 1
+		self.max_index_reads = max(self.max_index_reads, index_reads)
+		self.index_time += self.ticks_diff(self.ticks(), start_time)
+
+
+class StatsFile(object):
+	'''包装字库文件，统计 seek 次数和读取的字节数'''
+	def __init__(self, font_file, stats):
+		self.__font_file = font_file
+		self.__stats = stats
+
+	def seek(self, offset):
+		self.__stats.seeks += 1
+		return self.__font_file.seek(offset)
+
+	def read(self, size):
+		data = self.__font_file.read(size)
+		self.__stats.bytes_read += len(data)
+		return data
+
+	def readinto(self, buffer):
+		count = self.__font_file.readinto(buffer)
+		self.__stats.bytes_read += count or 0
+		return count
+
+	def close(self):
+		self.__font_file.close()
+
+
+class MemoryFile(object):
+	'''内存中的字库文件，read() 返回数据的 memoryview 切片，不复制数据'''
+	def __init__(self, data):
+		self.__data = memoryview(data)
+		self.__position = 0
+
+	def seek(self, offset):
+		self.__position = offset
+		return offset
+
+	def read(self, size):
+		data = self.__data[self.__position:self.__position + size]
+		self.__position += len(data)
+		return data
+
+	def readinto(self, buffer):
+		data = self.read(len(buffer))
+		buffer[:len(data)] = data
+		return len(data)
+
+	def close(self):
+		'''释放字库数据'''
+		self.__data = None
+
+
 class FontLib(object):
 	FORMAT = {MONO_VLSB: 'MONO_VLSB', MONO_HMSB: 'MONO_HMSB', MONO_HLSB: 'MONO_HLSB'}
 	ASCII_START = const(0x20)
 	ASCII_END = const(0x7f)
 	GB2312_START = const(0x80)
 	GB2312_END = const(0xffef)
+	MAX_READ_SIZE = const(1024)
+	ZEROS = bytes(128)
+	COVERAGE_SIZE = const(8192)
+	MIN_RUN = const(8)
+	MISSING = const(0xffff)
+	TAG_SAMPLE = const(256)
+	FETCH_CHUNK = const(30)
 
-	def __init__(self, font_filename):
+	def __init__(self, font_filename, page_size=0, cache_size=0, keep_open=False, stats=None, read_gap=0, in_memory=False, coverage=False, range_table=False, hot_chars=None, index_cache=0):
 		self.__font_filename = font_filename
 		self.__header = None
+		self.__probe = bytearray(2)
+		self.__page_size = page_size
+		self.__page_directory = None
+		self.__page_buffer = None
+		self.__cache = None
+		self.__keep_open = keep_open or in_memory
+		self.__in_memory = in_memory
+		self.__font_file = None
+		self.__lock = _thread.allocate_lock() if _thread else None
+		self.__scratch_buffer = None
+		self.__scratch_fb = None
+		self.__blocks = {}
+		self.__stats = stats
+		self.__read_gap = read_gap
+		self.__advances = None
+		self.__glyph_offsets = 0
+		self.__offset_probe = None
+		self.__packed = None
+		self.__coverage = None
+		self.__segments = None
+		self.__segment_address = 0
+		self.__key_probe = None
+		self.__hot_codes = None
+		self.__hot_ids = None
+		self.__index_cache_size = index_cache
+		self.__index_codes = None
+		self.__index_ids = None
+		self.__index_learned = None
+		self.__tag = None
+
+		font_file = self.__open_file()
+		try:
+			header_data = bytes(font_file.read(FontLibHeader.LENGTH))
+			if header_data[:4] == b'FMUZ':
+				header_data += bytes(font_file.read(FontLibHeader.LENGTH_V2 - FontLibHeader.LENGTH))
+
+			self.__header = FontLibHeader(memoryview(header_data))
+			self.__blocks = self.__read_block_table(font_file)
+
+			if self.__header.version == 1 and self.__header.index_sorted:
+				self.__check_sorted(font_file)
+
+			if index_cache > 0:
+				self.__tag = self.__make_sidecar_tag(font_file)
+
+			if self.__header.glyph_compressed:
+				if FontLibHeader.BLOCK_GLYPH_OFFSETS not in self.__blocks:
+					raise FontLibHeaderException('Missing glyph offset table')
+
+				self.__glyph_offsets = self.__blocks[FontLibHeader.BLOCK_GLYPH_OFFSETS][0]
+				self.__offset_probe = bytearray(8)
+				self.__packed = bytearray(self.__header.data_size + self.__header.data_size // 128 + 1)
+
+			if FontLibHeader.BLOCK_SEGMENTS in self.__blocks:
+				self.__load_segments(font_file)
+
+			if range_table:
+				self.__build_range_table(font_file)
+
+			self.__placeholder_buffer = bytes(self.__get_character_unicode_buffer(font_file, {ord('?')})[0][1]) # [ord('?')]
+
+			if FontLibHeader.BLOCK_HOT in self.__blocks or hot_chars:
+				self.__load_hot_table(font_file, hot_chars)
+
+			if FontLibHeader.BLOCK_ADVANCES in self.__blocks:
+				address, length = self.__blocks[FontLibHeader.BLOCK_ADVANCES]
+				self.__advances = bytearray(length)
+				font_file.seek(address)
+				font_file.readinto(self.__advances)
+				self.__placeholder_advance = self.__advance(self.__locate_one(font_file, ord('?')))
+
+			if self.__page_size > 0 and self.__header.index_sorted:
+				self.__load_page_directory(font_file)
+		finally:
+			self.__close_file(font_file)
+
+		if coverage:
+			self.__load_coverage()
+
+		if cache_size > 0:
+			self.__cache = GlyphCache(cache_size, self.__header.data_size)
+
+	def __check_sorted(self, font_file):
+		'''抽查旧版字库索引表的首、中、尾三项，顺序不对时按未排序处理，避免二分查找找不到字符'''
+		count = self.__header.index_count
+		codes = []
+
+		if count < 2:
+			return
+
+		for index in (0, count // 2, count - 1):
+			font_file.seek(self.__header.index_table_address + index * 2)
+			codes.append(struct.unpack('<H', font_file.read(2))[0])
+
+		if not codes[0] <= codes[1] <= codes[2]:
+			self.__header.index_sorted = False
+
+	def __read_block_table(self, font_file):
+		'''读取扩展数据块列表，返回 {tag: (address, length)}'''
+		blocks = {}
+		if not self.__header.block_table_address:
+			return blocks
+
+		font_file.seek(self.__header.block_table_address)
+		count = struct.unpack('<H', font_file.read(2))[0]
+
+		for _ in range(count):
+			tag, address, length = struct.unpack('<4sII', font_file.read(12))
+			blocks[tag] = (address, length)
+
+		return blocks
+
+	def __load_segments(self, font_file):
+		'''读入分段索引的段列表，每段依次为起始编码、结束编码、第一个字符序号、字符数量和键表偏移量'''
+		self.__segment_address = self.__blocks[FontLibHeader.BLOCK_SEGMENTS][0]
+		font_file.seek(self.__segment_address)
+		count = struct.unpack('<H', font_file.read(2))[0]
+
+		self.__segments = array('I', struct.unpack('<{}I'.format(count * 5), font_file.read(count * 20)))
+		self.__key_probe = bytearray(4)
+
+	def __load_hot_table(self, font_file, hot_chars):
+		'''载入常用字表，包括 HOTB 数据块和 hot_chars 中的字符，查找这些字符时不需要读取索引表'''
+		hot_dict = {}
+
+		if FontLibHeader.BLOCK_HOT in self.__blocks:
+			font_file.seek(self.__blocks[FontLibHeader.BLOCK_HOT][0])
+			count = struct.unpack('<H', font_file.read(2))[0]
+			data = font_file.read(count * 6)
+			hot_dict = dict(zip(struct.unpack('<{}I'.format(count), data[:count * 4]), struct.unpack('<{}H'.format(count), data[count * 4:])))
+
+		if hot_chars:
+			for unicode, char_offset in self.__locate(font_file, set(ord(char) for char in hot_chars)):
+				if char_offset is not None and not self.__is_ascii(unicode):
+					hot_dict[unicode] = self.__glyph_id(char_offset)
+
+		if not hot_dict:
+			return
+
+		unicode_list = sorted(hot_dict)
+		self.__hot_codes = array('I', unicode_list)
+		self.__hot_ids = array('H', [hot_dict[unicode] for unicode in unicode_list])
+
+	@staticmethod
+	def __bisect(codes, unicode):
+		'''在按编码排序的 codes 中二分查找 unicode，返回其位置，没有时返回 -1'''
+		low = 0
+		high = len(codes) - 1
+
+		while low <= high:
+			middle = (low + high) // 2
+
+			if unicode < codes[middle]:
+				high = middle - 1
+			elif unicode > codes[middle]:
+				low = middle + 1
+			else:
+				return middle
+
+		return -1
+
+	def __find_hot(self, unicode):
+		'''在常用字表中二分查找字符，返回字符数据的偏移量，不是常用字时返回 None'''
+		position = FontLib.__bisect(self.__hot_codes, unicode)
+		if position < 0:
+			return None
+
+		if self.__stats is not None:
+			self.__stats.hot_hits += 1
+
+		return self.__header.gb2312_start + (self.__hot_ids[position] - 96) * self.__header.data_size
+
+	def __load_index_cache(self):
+		'''从 .idx 附属文件载入之前查找到的字符和字符序号，附属文件不存在或者与字库文件不对应时从空表开始'''
+		self.__index_codes = array('I')
+		self.__index_ids = array('H')
+		self.__index_learned = {}
+
+		try:
+			with open(self.__sidecar('.idx'), 'rb') as sidecar:
+				tag = self.__sidecar_tag()
+				head = sidecar.read(10)
+				if not tag or len(head) != 10 or head[:8] != tag:
+					return
 
+				count = struct.unpack('<H', head[8:])[0]
+				data = sidecar.read(count * 6)
+		except OSError:
+			return
+
+		if len(data) == count * 6:
+			self.__index_codes = array('I', struct.unpack('<{}I'.format(count), data[:count * 4]))
+			self.__index_ids = array('H', struct.unpack('<{}H'.format(count), data[count * 4:]))
+
+	def __find_indexed(self, unicode):
+		'''在索引缓存中查找字符，返回字符序号，字库未收录的字符为 FontLib.MISSING，没有查找过的字符返回 None'''
+		if self.__index_codes is None:
+			self.__load_index_cache()
+
+		position = FontLib.__bisect(self.__index_codes, unicode)
+		if position >= 0:
+			glyph_id = self.__index_ids[position]
+		else:
+			glyph_id = self.__index_learned.get(unicode)
+			if glyph_id is None:
+				return None
+
+		if self.__stats is not None:
+			self.__stats.index_cache_hits += 1
+
+		return glyph_id
+
+	def __indexed_offset(self, glyph_id):
+		'''把索引缓存中的字符序号转换为字符数据的偏移量，FontLib.MISSING 转换为 None'''
+		if glyph_id == FontLib.MISSING:
+			return None
+
+		return self.__header.gb2312_start + (glyph_id - 96) * self.__header.data_size
+
+	def __remember(self, unicode, char_offset):
+		'''把通过索引表查找的结果记入索引缓存，未收录的字符记为 FontLib.MISSING，超过 index_cache 个字符后不再记录'''
+		if len(self.__index_codes) + len(self.__index_learned) < self.__index_cache_size:
+			self.__index_learned[unicode] = FontLib.MISSING if char_offset is None else self.__glyph_id(char_offset)
+
+	def __save_index_cache(self, path=None):
+		if self.__index_codes is None:
+			self.__load_index_cache()
+
+		if not self.__sidecar_tag():
+			return
+
+		index_dict = dict(zip(self.__index_codes, self.__index_ids))
+		index_dict.update(self.__index_learned)
+		unicode_list = sorted(index_dict)[:0xffff]
+		count = len(unicode_list)
+
+		with open(path or self.__sidecar('.idx'), 'wb') as sidecar:
+			sidecar.write(self.__sidecar_tag())
+			sidecar.write(struct.pack('<H', count))
+			sidecar.write(struct.pack('<{}I'.format(count), *unicode_list))
+			sidecar.write(struct.pack('<{}H'.format(count), *[index_dict[unicode] for unicode in unicode_list]))
+
+		self.__index_codes = array('I', unicode_list)
+		self.__index_ids = array('H', [index_dict[unicode] for unicode in unicode_list])
+		self.__index_learned = {}
+
+	def save_index_cache(self, path=None):
+		'''把索引缓存保存为附属文件，默认与字库文件同名，扩展名为 .idx，重启后查找这些字符不需要读取索引表'''
+		if self.__lock:
+			self.__lock.acquire()
+
+		try:
+			self.__save_index_cache(path)
+		finally:
+			if self.__lock:
+				self.__lock.release()
+
+	def __build_range_table(self, font_file):
+		'''读取一次索引表，把编码连续且不少于 MIN_RUN 个的字符作为连续段加入段列表，查找这些字符时直接计算字符数据的位置'''
+		segments = []
+		state = [0, -2, 0] # 索引位置, 上一个编码, 当前连续段的起始索引位置
+
+		def flush(position, previous, first):
+			if position - first >= FontLib.MIN_RUN:
+				segments.append((previous - (position - first) + 1, previous, 96 + first, position - first, 0))
+
+		def visit(buffer, count):
+			position, previous, first = state
+
+			for index in range(1, count, 2):
+				unicode = buffer[index] << 8 | buffer[index - 1]
+
+				if unicode != previous + 1:
+					flush(position, previous, first)
+					first = position
+
+				previous = unicode
+				position += 1
+
+			state[0] = position
+			state[1] = previous
+			state[2] = first
+
+		self.__scan_index(font_file, visit)
+		flush(*state)
+
+		if not segments:
+			return
+
+		if self.__segments is not None:
+			for segment in range(0, len(self.__segments), 5):
+				segments.append(tuple(self.__segments[segment:segment + 5]))
+
+		segments.sort(key=lambda segment: segment[0])
+		self.__segments = array('I', [value for segment in segments for value in segment])
+
+	def verify(self):
+		'''校验字库文件数据，旧版字库文件没有校验值，返回 None'''
+		if self.__header.checksum is None:
+			return None
+
+		try:
+			from binascii import crc32
+		except ImportError:
+			from ubinascii import crc32
+
+		if self.__lock:
+			self.__lock.acquire()
+
+		try:
+			font_file = self.__open_file()
+			try:
+				checksum = 0
+				buffer = bytearray(1024)
+				font_file.seek(self.__header.header_length)
+
+				for offset in range(self.__header.header_length, self.__header.file_size, len(buffer)):
+					count = font_file.readinto(buffer)
+					if not count:
+						break
+
+					checksum = crc32(memoryview(buffer)[:min(count, self.__header.file_size - offset)], checksum)
+			finally:
+				self.__close_file(font_file)
+		finally:
+			if self.__lock:
+				self.__lock.release()
+
+		return checksum & 0xffffffff == self.__header.checksum
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def __open_file(self):
+		'''常驻模式和内存模式下复用已打开的字库文件，否则每次重新打开'''
+		stats = self.__stats
+
+		if not self.__keep_open:
+			font_file = open(self.__font_filename, 'rb')
+			if stats is None:
+				return font_file
+
+			stats.opens += 1
+			return StatsFile(font_file, stats)
+
+		if self.__font_file is None:
+			self.__font_file = self.__load_file() if self.__in_memory else open(self.__font_filename, 'rb')
+			if stats is not None:
+				stats.opens += 1
+
+		if stats is not None:
+			return StatsFile(self.__font_file, stats)
+
+		return self.__font_file
+
+	def __load_file(self):
+		'''把整个字库文件读入一个 bytearray'''
 		with open(self.__font_filename, 'rb') as font_file:
-			self.__header = FontLibHeader(memoryview(font_file.read(FontLibHeader.LENGTH)))
-			self.__placeholder_buffer = self.__get_character_unicode_buffer(font_file, {ord('?')}, True)[0][1] # [ord('?')]
+			size = font_file.seek(0, 2)
+			font_file.seek(0)
+
+			gc.collect()
+			data = bytearray(size)
+			font_file.readinto(data)
+
+		return MemoryFile(data)
+
+	def __close_file(self, font_file):
+		if not self.__keep_open:
+			font_file.close()
+
+	def close(self):
+		'''关闭常驻的字库文件或者释放内存中的字库数据，之后再读取时会重新打开，索引缓存有新记录的字符时同时保存，保存失败时跳过'''
+		if self.__lock:
+			self.__lock.acquire()
+
+		try:
+			if self.__index_learned:
+				try:
+					self.__save_index_cache()
+				except OSError:
+					pass
+
+			if self.__font_file is not None:
+				self.__font_file.close()
+				self.__font_file = None
+		finally:
+			if self.__lock:
+				self.__lock.release()
 
 	def __is_ascii(self, char_code):
 		return FontLib.ASCII_START <= char_code <= FontLib.ASCII_END
@@ -74,10 +803,109 @@ class FontLib(object):
 	def __is_gb2312(self, char_code):
 		return FontLib.GB2312_START <= char_code <= FontLib.GB2312_END
 
-	def __get_character_unicode_buffer(self, font_file, unicode_set, is_placeholder=False):
-		buffer_list = []
-		ascii_list = []
+	def __covered(self, char_code):
+		'''根据覆盖位图判断字库是否收录了该字符，没有覆盖位图时总是返回 True'''
+		coverage = self.__coverage
+		return coverage is None or coverage[char_code >> 3] & (1 << (char_code & 7)) != 0
+
+	def __load_page_directory(self, font_file):
+		'''读取索引表，记录每页第一个字符的 Unicode 值，查找时只需要读取一页索引'''
+		pages = (self.__header.index_count + self.__page_size - 1) // self.__page_size
+		self.__page_directory = array('H')
+		self.__page_buffer = bytearray(self.__page_size * 2)
+
+		font_file.seek(self.__header.index_table_address)
+		for _ in range(pages):
+			font_file.readinto(self.__page_buffer)
+			self.__page_directory.append(self.__page_buffer[0] | self.__page_buffer[1] << 8)
+
+	def __search_page(self, font_file, unicode):
+		'''在页目录中查找字符所在的页，然后读取该页索引并二分查找'''
+		directory = self.__page_directory
+		low = 0
+		high = len(directory) - 1
+
+		if high < 0 or unicode < directory[0]:
+			return None
+
+		while low < high:
+			middle = (low + high + 1) >> 1
+			if directory[middle] <= unicode:
+				low = middle
+			else:
+				high = middle - 1
+
+		first = low * self.__page_size
+		count = min(self.__page_size, self.__header.index_count - first)
+		buffer = self.__page_buffer
+
+		font_file.seek(self.__header.index_table_address + first * 2)
+		font_file.readinto(buffer)
+
+		if self.__stats is not None:
+			self.__stats.index_reads += 1
+
+		low = 0
+		high = count - 1
+		while low <= high:
+			middle = (low + high) >> 1
+			code = buffer[middle * 2] | buffer[middle * 2 + 1] << 8
+
+			if code < unicode:
+				low = middle + 1
+			elif code > unicode:
+				high = middle - 1
+			else:
+				return self.__header.index_table_address + (first + middle) * 2
+
+		return None
+
+	def __search(self, font_file, unicode):
+		'''在已排序的索引表中二分查找字符，返回字符在索引表中的偏移量'''
+		if self.__page_directory is not None:
+			return self.__search_page(font_file, unicode)
+
+		probe = self.__probe
+		stats = self.__stats
+		low = 0
+		high = self.__header.index_count - 1
+
+		while low <= high:
+			middle = (low + high) >> 1
+			font_file.seek(self.__header.index_table_address + middle * 2)
+			font_file.readinto(probe)
+
+			if stats is not None:
+				stats.index_reads += 1
+			code = probe[0] | probe[1] << 8
+
+			if code < unicode:
+				low = middle + 1
+			elif code > unicode:
+				high = middle - 1
+			else:
+				return self.__header.index_table_address + middle * 2
+
+		return None
+
+	def __locate(self, font_file, unicode_set):
+		'''查找字符数据在字库文件中的偏移量，返回 [[unicode, offset], ...]，未收录的字符 offset 为 None'''
+		located_list = []
+
+		for _ in self.__locate_steps(font_file, unicode_set, located_list):
+			pass
+
+		return located_list
+
+	def __locate_steps(self, font_file, unicode_set, located_list):
+		'''分步查找字符数据的偏移量并添加到 located_list，每读取一段索引表或查找一个字符后暂停一次'''
 		gb2312_list = []
+		segment_list = []
+		stats = self.__stats
+
+		if stats is not None:
+			start_time = stats.ticks()
+			index_reads = stats.index_reads
 		chunk_size = const(1000)
 
 		def __seek(offset, data, targets):
@@ -106,65 +934,942 @@ class FontLib(object):
 
 			return seeked_count == len(targets)
 
-		gc.disable()
 		for unicode in unicode_set:
 			if unicode in (9, 10, 13): continue
 			if self.__is_ascii(unicode):
 				char_offset = self.__header.ascii_start + (unicode - FontLib.ASCII_START) * self.__header.data_size
-				ascii_list.append([unicode, char_offset])
-			elif self.__is_gb2312(unicode):
-				gb2312_list.append([unicode, struct.pack('<H', unicode), None])
-			else:
-				buffer_list.append([unicode, memoryview(self.__placeholder_buffer)])
-
-		del unicode_set
-
-		for ascii in ascii_list:
-			font_file.seek(ascii[1])
-			buffer_list.append([ascii[0], memoryview(font_file.read(self.__header.data_size))])
-		gc.enable()
+				located_list.append([unicode, char_offset])
+				continue
 
-		if is_placeholder:
-			return buffer_list
+			if self.__hot_codes is not None:
+				char_offset = self.__find_hot(unicode)
+				if char_offset is not None:
+					located_list.append([unicode, char_offset])
+					continue
 
-		del ascii_list
+			segment = -1 if self.__segments is None else self.__find_segment(unicode)
+			if segment >= 0:
+				segment_list.append((unicode, segment))
+			elif self.__is_gb2312(unicode) and self.__covered(unicode):
+				glyph_id = self.__find_indexed(unicode) if self.__index_cache_size else None
+				if glyph_id is None:
+					gb2312_list.append([unicode, struct.pack('<H', unicode), None])
+				else:
+					located_list.append([unicode, self.__indexed_offset(glyph_id)])
+			else:
+				located_list.append([unicode, None])
 
-		if len(gb2312_list):
-			font_file.seek(self.__header.index_table_address)
+		for unicode, segment in segment_list:
+			located_list.append([unicode, self.__locate_segment(font_file, unicode, segment)])
+			yield
 
+		if len(gb2312_list) and self.__header.index_sorted:
+			for gb2312 in gb2312_list:
+				gb2312[2] = self.__search(font_file, gb2312[0])
+				yield
+		elif len(gb2312_list):
 			for offset in range(self.__header.index_table_address, self.__header.ascii_start, chunk_size):
-				if __seek(offset, font_file.read(chunk_size), gb2312_list):
+				if stats is not None:
+					stats.index_reads += 1
+
+				font_file.seek(offset)
+				if __seek(offset, bytes(font_file.read(chunk_size)), gb2312_list):
 					break
+
+				yield
 			else:
-				__seek(self.__header.ascii_start - offset, font_file.read(chunk_size), gb2312_list)
+				font_file.seek(offset + chunk_size)
+				__seek(self.__header.ascii_start - offset, bytes(font_file.read(chunk_size)), gb2312_list)
 
-		gc.disable()
 		for gb2312 in gb2312_list:
 			if gb2312[2] is None:
-				buffer_list.append([gb2312[0], memoryview(self.__placeholder_buffer)])
+				char_offset = None
 			else:
-				char_offset = int(self.__header.gb2312_start + (gb2312[2] - self.__header.index_table_address) / 2 * self.__header.data_size)
+				char_offset = self.__header.gb2312_start + (gb2312[2] - self.__header.index_table_address) // 2 * self.__header.data_size
 
-				font_file.seek(char_offset)
-				buffer_list.append([gb2312[0], memoryview(font_file.read(self.__header.data_size))])
-		gc.enable()
-		gc.collect()
+			located_list.append([gb2312[0], char_offset])
+
+			if self.__index_cache_size:
+				self.__remember(gb2312[0], char_offset)
 
 		del gb2312_list
+
+		if stats is not None:
+			stats.lookup_done(stats.index_reads - index_reads, start_time)
+
+	def __find_segment(self, unicode):
+		'''二分查找编码范围包含 unicode 的段，返回该段在段列表中的位置，没有时返回 -1'''
+		segments = self.__segments
+		low = 0
+		high = len(segments) // 5 - 1
+
+		while low <= high:
+			middle = (low + high) // 2
+
+			if unicode < segments[middle * 5]:
+				high = middle - 1
+			elif unicode > segments[middle * 5 + 1]:
+				low = middle + 1
+			else:
+				return middle * 5
+
+		return -1
+
+	def __locate_segment(self, font_file, unicode, segment):
+		'''在段中查找字符数据的偏移量，连续段直接计算，稀疏段先查找索引缓存再在键表中二分查找，未收录的字符返回 None'''
+		segments = self.__segments
+		keys = segments[segment + 4]
+
+		if keys == 0:
+			position = unicode - segments[segment]
+		else:
+			if self.__index_cache_size:
+				glyph_id = self.__find_indexed(unicode)
+				if glyph_id is not None:
+					return self.__indexed_offset(glyph_id)
+
+			stats = self.__stats
+			probe = self.__key_probe
+			position = None
+			low = 0
+			high = segments[segment + 3] - 1
+
+			while low <= high:
+				middle = (low + high) // 2
+
+				if stats is not None:
+					stats.index_reads += 1
+
+				font_file.seek(self.__segment_address + keys + middle * 4)
+				font_file.readinto(probe)
+				key = struct.unpack('<I', probe)[0]
+
+				if unicode < key:
+					high = middle - 1
+				elif unicode > key:
+					low = middle + 1
+				else:
+					position = middle
+					break
+
+			if position is None:
+				if self.__index_cache_size:
+					self.__remember(unicode, None)
+
+				return None
+
+		char_offset = self.__header.gb2312_start + (segments[segment + 2] + position - 96) * self.__header.data_size
+
+		if keys and self.__index_cache_size:
+			self.__remember(unicode, char_offset)
+
+		return char_offset
+
+	def __segment_codes(self, font_file):
+		'''按段的顺序返回分段索引收录的所有字符'''
+		segments = self.__segments
+
+		for segment in range(0, len(segments), 5):
+			if segments[segment + 4] == 0:
+				for unicode in range(segments[segment], segments[segment + 1] + 1):
+					yield unicode
+
+				continue
+
+			for start in range(0, segments[segment + 3], 256):
+				count = min(256, segments[segment + 3] - start)
+				font_file.seek(self.__segment_address + segments[segment + 4] + start * 4)
+
+				for unicode in struct.unpack('<{}I'.format(count), font_file.read(count * 4)):
+					yield unicode
+
+	def __locate_all(self, font_file, unicode_list):
+		'''查找所有字符数据的偏移量，返回 {unicode: offset}'''
+		located_dict = {}
+
+		for char in self.__locate(font_file, unicode_list):
+			located_dict[char[0]] = char[1]
+
+		return located_dict
+
+	def __locate_one(self, font_file, unicode):
+		'''查找单个字符数据的偏移量，未收录的字符返回 None，与批量查找共用 __locate_steps 中的查找顺序'''
+		for char in self.__locate(font_file, (unicode,)):
+			return char[1]
+
+		return None
+
+	def __get_character_unicode_buffer(self, font_file, unicode_set, placeholder=True):
+		buffer_list = []
+
+		located_list = self.__locate(font_file, unicode_set)
+		del unicode_set
+
+		# 读取时暂停自动垃圾回收，每读取 FETCH_CHUNK 个字符恢复一次，避免字符较多时内存不断增长
+		collected = 0
+		gc.disable()
+		try:
+			for _ in self.__fetch_steps(font_file, located_list, buffer_list, placeholder):
+				if len(buffer_list) - collected >= FontLib.FETCH_CHUNK:
+					gc.enable()
+					gc.collect()
+					gc.disable()
+					collected = len(buffer_list)
+		finally:
+			gc.enable()
+
+		gc.collect()
+
+		del located_list
 		return buffer_list
 
-	def get_characters(self, characters: str):
+	def __fetch_steps(self, font_file, located_list, buffer_list, placeholder=True):
+		'''分步读取字符数据并添加到 buffer_list，每读取一次暂停一次，placeholder 为 False 时不添加未收录的字符'''
+		stats = self.__stats
+		if stats is not None:
+			start_time = stats.ticks()
+
+		for char in located_list:
+			if char[1] is None and placeholder:
+				buffer_list.append([char[0], self.__placeholder_buffer])
+
+				if stats is not None:
+					stats.placeholders += 1
+
+		yield from self.__read_runs(font_file, [char for char in located_list if char[1] is not None], buffer_list)
+
+		if stats is not None:
+			stats.read_time += stats.ticks_diff(stats.ticks(), start_time)
+
+	def __read_runs(self, font_file, located_list, buffer_list):
+		'''按偏移量顺序分步读取字符数据，间隔不超过 read_gap 的相邻字符合并为一次读取，字符数据为读取结果的 memoryview 切片'''
+		data_size = self.__header.data_size
+		limit = max(FontLib.MAX_READ_SIZE, data_size)
+		located_list.sort(key=lambda char: char[1])
+
+		if self.__packed is not None:
+			for char in located_list:
+				buffer = bytearray(data_size)
+				self.__read_packed(font_file, char[1], buffer, 0)
+				buffer_list.append([char[0], memoryview(buffer)])
+				yield
+
+			return
+
+		index = 0
+		while index < len(located_list):
+			start = located_list[index][1]
+			end = start + data_size
+			last = index + 1
+
+			while last < len(located_list):
+				char_offset = located_list[last][1]
+				if char_offset - end > self.__read_gap or char_offset + data_size - start > limit:
+					break
+
+				end = max(end, char_offset + data_size)
+				last += 1
+
+			font_file.seek(start)
+			data = memoryview(font_file.read(end - start))
+
+			for char in located_list[index:last]:
+				buffer_list.append([char[0], data[char[1] - start:char[1] - start + data_size]])
+
+			index = last
+			yield
+
+	def __read_into(self, font_file, char_offset, buffer, offset):
+		data_size = self.__header.data_size
+		stats = self.__stats
+
+		if stats is not None:
+			start_time = stats.ticks()
+
+		if char_offset is None:
+			buffer[offset:offset + data_size] = self.__placeholder_buffer
+
+			if stats is not None:
+				stats.placeholders += 1
+		elif self.__packed is not None:
+			self.__read_packed(font_file, char_offset, buffer, offset)
+		else:
+			font_file.seek(char_offset)
+			font_file.readinto(memoryview(buffer)[offset:offset + data_size])
+
+		if stats is not None:
+			stats.read_time += stats.ticks_diff(stats.ticks(), start_time)
+
+	def __glyph_id(self, char_offset):
+		'''把字符数据的偏移量转换为字符序号，ASCII 字符在前，索引表中的字符在后'''
+		if char_offset >= self.__header.gb2312_start:
+			return 96 + (char_offset - self.__header.gb2312_start) // self.__header.data_size
+
+		return (char_offset - self.__header.ascii_start) // self.__header.data_size
+
+	def __read_packed(self, font_file, char_offset, buffer, offset):
+		'''通过字符偏移表读取压缩的字符数据，解压到 buffer 的 offset 位置'''
+		font_file.seek(self.__glyph_offsets + self.__glyph_id(char_offset) * 4)
+		font_file.readinto(self.__offset_probe)
+		address, end = struct.unpack('<II', self.__offset_probe)
+
+		packed = memoryview(self.__packed)[:end - address]
+		font_file.seek(address)
+		font_file.readinto(packed)
+
+		self.__unpack(packed, buffer, offset)
+
+	@staticmethod
+	def __unpack(packed, buffer, offset):
+		'''解压游程编码的字符数据，小于 0x80 的控制字节后跟 n + 1 个原始字节，否则表示 (n & 0x7f) + 1 个 0'''
+		index = 0
+		length = len(packed)
+
+		while index < length:
+			count = packed[index]
+			index += 1
+
+			if count & 0x80:
+				count = (count & 0x7f) + 1
+				buffer[offset:offset + count] = FontLib.ZEROS[:count]
+			else:
+				count += 1
+				buffer[offset:offset + count] = packed[index:index + count]
+				index += count
+
+			offset += count
+
+	def __advance(self, char_offset):
+		'''根据字符数据的偏移量返回字符宽度，未收录的字符返回占位符的宽度'''
+		if self.__advances is None:
+			return self.__header.font_width
+
+		if char_offset is None:
+			return self.__placeholder_advance
+
+		return self.__advances[self.__glyph_id(char_offset)]
+
+	def __scan_index(self, font_file, visit):
+		'''分段读取整个索引表，每读取一段调用一次 visit(buffer, count)'''
+		buffer = bytearray(FontLib.MAX_READ_SIZE)
+		address = self.__header.index_table_address
+		end = address + self.__header.index_count * 2
+		font_file.seek(address)
+
+		while address < end:
+			count = font_file.readinto(memoryview(buffer)[:min(len(buffer), end - address)])
+			if not count:
+				break
+
+			visit(buffer, count)
+			address += count
+
+	def __sidecar(self, extension):
+		'''返回与字库文件同名、扩展名为 extension 的附属文件路径'''
+		name = self.__font_filename
+		dot = name.rfind('.')
+		if dot > name.rfind('/'):
+			name = name[:dot]
+
+		return name + extension
+
+	def __sidecar_tag(self):
+		'''附属文件的文件头，记录字库文件的大小和校验值，用于判断附属文件是否与字库文件对应，无法计算校验值时返回空字节串'''
+		if self.__tag is None:
+			font_file = self.__open_file()
+			try:
+				self.__tag = self.__make_sidecar_tag(font_file)
+			finally:
+				self.__close_file(font_file)
+
+		return self.__tag
+
+	def __make_sidecar_tag(self, font_file):
+		'''旧版字库文件没有校验值，使用文件头和索引表首尾各 TAG_SAMPLE 字节的 crc32 代替，只需要读取很少的数据'''
+		checksum = self.__header.checksum
+
+		if checksum is None:
+			try:
+				from binascii import crc32
+			except ImportError:
+				try:
+					from ubinascii import crc32
+				except ImportError:
+					return b''
+
+			font_file.seek(0)
+			checksum = crc32(bytes(font_file.read(FontLibHeader.LENGTH)))
+			index_size = self.__header.index_count * 2
+			sample_size = min(FontLib.TAG_SAMPLE, index_size)
+
+			for address in (0, index_size - sample_size):
+				font_file.seek(self.__header.index_table_address + address)
+				checksum = crc32(bytes(font_file.read(sample_size)), checksum)
+
+			checksum &= 0xffffffff
+
+		return struct.pack('<II', self.__header.file_size, checksum)
+
+	def __load_coverage(self):
+		'''依次尝试从 COVR 数据块和 .cov 附属文件载入覆盖位图，都没有时读取索引表生成'''
+		coverage = bytearray(FontLib.COVERAGE_SIZE)
+
+		font_file = self.__open_file()
+		try:
+			if FontLibHeader.BLOCK_COVERAGE in self.__blocks:
+				address, length = self.__blocks[FontLibHeader.BLOCK_COVERAGE]
+				if length != FontLib.COVERAGE_SIZE:
+					raise FontLibHeaderException('Invalid coverage block')
+
+				font_file.seek(address)
+				font_file.readinto(coverage)
+			elif not self.__read_coverage_sidecar(coverage):
+				def visit(buffer, count):
+					for index in range(1, count, 2):
+						if buffer[index] or buffer[index - 1]:
+							coverage[buffer[index] << 5 | buffer[index - 1] >> 3] |= 1 << (buffer[index - 1] & 7)
+
+				for index in range(FontLib.ASCII_START >> 3, (FontLib.ASCII_END + 1) >> 3):
+					coverage[index] = 0xff
+
+				self.__scan_index(font_file, visit)
+
+				if self.__segments is not None:
+					for unicode in self.__segment_codes(font_file):
+						if unicode <= FontLib.GB2312_END:
+							coverage[unicode >> 3] |= 1 << (unicode & 7)
+		finally:
+			self.__close_file(font_file)
+
+		self.__coverage = coverage
+
+	def __read_coverage_sidecar(self, coverage):
+		try:
+			with open(self.__sidecar('.cov'), 'rb') as sidecar:
+				tag = self.__sidecar_tag()
+				return bool(tag) and sidecar.read(8) == tag and sidecar.readinto(coverage) == FontLib.COVERAGE_SIZE
+		except OSError:
+			return False
+
+	def coverage(self):
+		'''返回覆盖位图，第 n 位为 1 表示字库收录了 Unicode 编码为 n 的字符，没有载入时先载入或生成'''
+		if self.__coverage is None:
+			if self.__lock:
+				self.__lock.acquire()
+
+			try:
+				self.__load_coverage()
+			finally:
+				if self.__lock:
+					self.__lock.release()
+
+		return self.__coverage
+
+	def save_coverage(self, path=None):
+		'''把覆盖位图保存为附属文件，默认与字库文件同名，扩展名为 .cov'''
+		coverage = self.coverage()
+
+		if not self.__sidecar_tag():
+			raise FontLibException('Can not checksum font file for sidecar')
+
+		with open(path or self.__sidecar('.cov'), 'wb') as sidecar:
+			sidecar.write(self.__sidecar_tag())
+			sidecar.write(coverage)
+
+	def has_glyph(self, unicode):
+		'''字库是否收录了该字符，载入覆盖位图后不需要读取索引表'''
+		if self.__is_ascii(unicode):
+			return True
+
+		if self.__is_gb2312(unicode):
+			if self.__coverage is not None:
+				return self.__covered(unicode)
+		elif self.__segments is None:
+			return False
+
+		if self.__lock:
+			self.__lock.acquire()
+
+		try:
+			font_file = self.__open_file()
+			try:
+				return self.__locate_one(font_file, unicode) is not None
+			finally:
+				self.__close_file(font_file)
+		finally:
+			if self.__lock:
+				self.__lock.release()
+
+	def code_ranges(self):
+		'''返回字库收录字符的编码范围 [(start, end), ...]，索引表中的字符按每 256 个编码一组统计，之后是分段索引中每一段的范围
+
+		结果是收录范围的概要，范围内的字符不一定都被收录，范围外的字符一定没有被收录'''
+		pages = bytearray(32)
+		coverage = self.__coverage
+
+		def visit(buffer, count):
+			for index in range(1, count, 2):
+				if buffer[index] or buffer[index - 1]:
+					pages[buffer[index] >> 3] |= 1 << (buffer[index] & 7)
+
+		if coverage is not None:
+			for page in range(1, 256):
+				if any(memoryview(coverage)[page << 5:(page + 1) << 5]):
+					pages[page >> 3] |= 1 << (page & 7)
+
+			if any(memoryview(coverage)[FontLib.GB2312_START >> 3:32]):
+				pages[0] |= 1
+		else:
+			if self.__lock:
+				self.__lock.acquire()
+
+			try:
+				font_file = self.__open_file()
+				try:
+					self.__scan_index(font_file, visit)
+				finally:
+					self.__close_file(font_file)
+			finally:
+				if self.__lock:
+					self.__lock.release()
+
+		ranges = [(FontLib.ASCII_START, FontLib.ASCII_END)]
+		start = None
+
+		for page in range(257):
+			if page < 256 and pages[page >> 3] & (1 << (page & 7)):
+				if start is None:
+					start = page
+			elif start is not None:
+				ranges.append((max(start << 8, FontLib.GB2312_START), min((page << 8) - 1, FontLib.GB2312_END)))
+				start = None
+
+		if self.__segments is not None:
+			for segment in range(0, len(self.__segments), 5):
+				ranges.append((self.__segments[segment], self.__segments[segment + 1]))
+
+		return ranges
+
+	def get_advances(self, characters: str):
+		'''获取字符宽度，返回 {unicode: 宽度}，等宽字库中所有字符的宽度都是 font_width'''
+		unicode_list = list(set(ord(char) for char in characters))
+
+		if self.__advances is None:
+			return {unicode: self.__header.font_width for unicode in unicode_list}
+
+		if self.__lock:
+			self.__lock.acquire()
+
+		try:
+			font_file = self.__open_file()
+			try:
+				return {unicode: self.__advance(char_offset) for unicode, char_offset in self.__locate_all(font_file, unicode_list).items()}
+			finally:
+				self.__close_file(font_file)
+		finally:
+			if self.__lock:
+				self.__lock.release()
+
+	def __cached(self, unicode):
+		'''从缓存中获取字符数据，同时统计缓存命中情况'''
+		buffer = self.__cache.get(unicode)
+
+		if self.__stats is not None:
+			if buffer is None:
+				self.__stats.cache_misses += 1
+			else:
+				self.__stats.cache_hits += 1
+
+		return buffer
+
+	def get_character_into(self, unicode, buffer, offset=0):
+		'''把一个字符数据直接读入 buffer 的 offset 位置，不再为字符数据分配内存'''
+		if len(buffer) - offset < self.__header.data_size:
+			raise FontLibException('Buffer too small')
+
+		if self.__lock:
+			self.__lock.acquire()
+
+		try:
+			if self.__cache is not None:
+				cached = self.__cached(unicode)
+				if cached is not None:
+					buffer[offset:offset + self.__header.data_size] = cached
+					return
+
+			font_file = self.__open_file()
+			try:
+				self.__read_into(font_file, self.__locate_one(font_file, unicode), buffer, offset)
+			finally:
+				self.__close_file(font_file)
+		finally:
+			if self.__lock:
+				self.__lock.release()
+
+	def get_characters_into(self, characters: str, buffer):
+		'''把所有字符数据依次读入一块连续的 buffer，返回 {unicode: 字符数据在 buffer 中的偏移量}'''
+		data_size = self.__header.data_size
+		offset_dict = {}
+
+		for char in characters:
+			unicode = ord(char)
+			if unicode in (9, 10, 13): continue
+			if unicode not in offset_dict:
+				offset_dict[unicode] = len(offset_dict) * data_size
+
+		if len(offset_dict) * data_size > len(buffer):
+			raise FontLibException('Buffer too small')
+
+		if self.__lock:
+			self.__lock.acquire()
+
+		try:
+			font_file = self.__open_file()
+			try:
+				located_list = self.__locate(font_file, list(offset_dict))
+				located_list.sort(key=lambda char: -1 if char[1] is None else char[1])
+
+				for char in located_list:
+					self.__read_into(font_file, char[1], buffer, offset_dict[char[0]])
+			finally:
+				self.__close_file(font_file)
+		finally:
+			if self.__lock:
+				self.__lock.release()
+
+		return offset_dict
+
+	def get_characters(self, characters: str, placeholder=True):
+		'''获取字符数据，启用缓存时，返回的缓存数据在下次调用前有效
+
+		placeholder 为 False 时，结果中不包含字库未收录的字符，而不是使用占位符代替'''
+		if self.__lock:
+			self.__lock.acquire()
+
+		try:
+			return self.__get_characters(characters, placeholder)
+		finally:
+			if self.__lock:
+				self.__lock.release()
+
+	def __get_characters(self, characters, placeholder=True):
 		result = {}
-		with open(self.__font_filename, 'rb') as font_file:
-			unicode_list = list(set(ord(char) for char in characters))
+		cache = self.__cache
+		unicode_list = list(set(ord(char) for char in characters))
+
+		if cache is not None:
+			cache.begin()
+			missed_list = []
 
-			chunk = 30
-			for count in range(0, len(unicode_list) // chunk + 1):
-				for char in self.__get_character_unicode_buffer(font_file, unicode_list[count * chunk:count * chunk + chunk]):
-					result[char[0]] = char[1]
+			for unicode in unicode_list:
+				buffer = self.__cached(unicode)
+				if buffer is None:
+					missed_list.append(unicode)
+				else:
+					result[unicode] = buffer
+
+			unicode_list = missed_list
+
+		if not unicode_list:
+			return result
+
+		font_file = self.__open_file()
+		try:
+			for char in self.__get_character_unicode_buffer(font_file, unicode_list, placeholder):
+				result[char[0]] = char[1]
+
+				if cache is not None and char[1] is not self.__placeholder_buffer:
+					buffer = cache.put(char[0], char[1])
+					if buffer is not None:
+						result[char[0]] = buffer
+		finally:
+			self.__close_file(font_file)
 
 		return result
 
+	async def get_characters_async(self, characters: str, budget=10):
+		'''get_characters() 的协程版本，查找索引和读取字符数据时每连续执行 budget 毫秒让出一次事件循环
+
+		返回的字符数据不会被缓存覆盖'''
+		result = {}
+		cache = self.__cache
+		unicode_list = list(set(ord(char) for char in characters))
+
+		if self.__lock:
+			self.__lock.acquire()
+
+		try:
+			if cache is not None:
+				cache.begin()
+				missed_list = []
+
+				for unicode in unicode_list:
+					buffer = self.__cached(unicode)
+					if buffer is None:
+						missed_list.append(unicode)
+					else:
+						result[unicode] = bytes(buffer)
+
+				unicode_list = missed_list
+
+			font_file = self.__open_file() if unicode_list else None
+		finally:
+			if self.__lock:
+				self.__lock.release()
+
+		if font_file is None:
+			return result
+
+		try:
+			located_list = []
+			await self.__run_steps(self.__locate_steps(font_file, unicode_list, located_list), budget)
+			del unicode_list
+
+			buffer_list = []
+			await self.__run_steps(self.__fetch_steps(font_file, located_list, buffer_list), budget)
+			del located_list
+		finally:
+			self.__close_file(font_file)
+
+		if self.__lock:
+			self.__lock.acquire()
+
+		try:
+			if cache is not None:
+				cache.begin()
+
+			for char in buffer_list:
+				result[char[0]] = char[1]
+
+				if cache is not None and char[1] is not self.__placeholder_buffer:
+					cache.put(char[0], char[1])
+		finally:
+			if self.__lock:
+				self.__lock.release()
+
+		return result
+
+	async def __run_steps(self, steps, budget):
+		'''执行分步查找或读取，每连续执行 budget 毫秒释放锁并让出一次事件循环'''
+		while True:
+			if self.__lock:
+				self.__lock.acquire()
+
+			try:
+				start_time = ticks_ms()
+
+				for _ in steps:
+					if ticks_diff(ticks_ms(), start_time) >= budget:
+						break
+				else:
+					return
+			finally:
+				if self.__lock:
+					self.__lock.release()
+
+			await asyncio.sleep_ms(0)
+
+	def iter_glyphs(self, text: str, window=16):
+		'''按文字顺序逐个返回 (char, 字符数据)，每次查找 window 个字符，控制字符的字符数据为 None
+
+		字符数据保存在固定大小的环形缓冲区中，只在下一次迭代前有效，占用的内存与文字长度无关
+		每批字符读取完成后就关闭字库文件，提前结束迭代时不会一直占用文件'''
+		ring = bytearray(window * self.__header.data_size)
+		part = []
+
+		for char in text:
+			part.append(char)
+
+			if len(part) == window:
+				yield from self.__iter_window(part, ring)
+				part = []
+
+		if part:
+			yield from self.__iter_window(part, ring)
+
+	def __iter_window(self, part, ring):
+		'''读取一批字符数据到环形缓冲区，然后按顺序返回，有字符需要读取时才打开字库文件'''
+		data_size = self.__header.data_size
+		views = memoryview(ring)
+		cache = self.__cache
+		slot_dict = {}
+
+		for char in part:
+			unicode = ord(char)
+			if unicode in (9, 10, 13): continue
+			if unicode not in slot_dict:
+				slot_dict[unicode] = len(slot_dict) * data_size
+
+		if self.__lock:
+			self.__lock.acquire()
+
+		try:
+			missed_list = []
+
+			if cache is not None:
+				cache.begin()
+
+			for unicode, offset in slot_dict.items():
+				cached = None if cache is None else self.__cached(unicode)
+
+				if cached is None:
+					missed_list.append(unicode)
+				else:
+					ring[offset:offset + data_size] = cached
+
+			if missed_list:
+				font_file = self.__open_file()
+				try:
+					located_list = self.__locate(font_file, missed_list)
+					located_list.sort(key=lambda char: -1 if char[1] is None else char[1])
+
+					for char in located_list:
+						offset = slot_dict[char[0]]
+						self.__read_into(font_file, char[1], ring, offset)
+
+						if cache is not None and char[1] is not None:
+							cache.put(char[0], views[offset:offset + data_size])
+				finally:
+					self.__close_file(font_file)
+		finally:
+			if self.__lock:
+				self.__lock.release()
+
+		for char in part:
+			offset = slot_dict.get(ord(char))
+			yield char, None if offset is None else views[offset:offset + data_size]
+
+	def draw_text(self, fb, text: str, x=0, y=0, width=None, height=None):
+		'''把文字直接绘制到 fb 中，遇到换行符或超出宽度时换行，超出高度的部分不再绘制，返回绘制结束时的光标位置
+
+		字库包含字符宽度表时，字符按各自的宽度紧密排列，fb 没有 width 和 height 属性（如 FrameBuffer）时需要指定 width 和 height'''
+		width = getattr(fb, 'width', None) if width is None else width
+		height = getattr(fb, 'height', None) if height is None else height
+
+		if width is None or height is None:
+			raise FontLibException('width and height are required for this target')
+		font_width = self.__header.font_width
+		font_height = self.__header.font_height
+		cache = self.__cache
+		proportional = self.__advances is not None
+		left = x
+
+		if self.__scratch_fb is None:
+			self.__scratch_buffer = bytearray(self.__header.data_size)
+			self.__scratch_fb = FrameBuffer(self.__scratch_buffer, self.__header.font_width, self.__header.font_height, self.__header.format)
+
+		if self.__lock:
+			self.__lock.acquire()
+
+		try:
+			font_file = self.__open_file()
+			try:
+				unicode_list = []
+				for char in set(text):
+					unicode = ord(char)
+					if cache is None or proportional or cache.get(unicode) is None:
+						unicode_list.append(unicode)
+
+				located_dict = self.__locate_all(font_file, unicode_list)
+				del unicode_list
+
+				for char in text:
+					unicode = ord(char)
+
+					if unicode == 10:
+						x = left
+						y += font_height
+						continue
+					if unicode in (9, 13): continue
+
+					advance = self.__advance(located_dict.get(unicode)) if proportional else font_width
+
+					if x + advance > width:
+						x = left
+						y += font_height
+
+					if y >= height:
+						break
+
+					if y + font_height > 0 and x + font_width > 0:
+						cached = None if cache is None else self.__cached(unicode)
+
+						if cached is not None:
+							self.__scratch_buffer[:] = cached
+						else:
+							self.__read_into(font_file, located_dict.get(unicode), self.__scratch_buffer, 0)
+
+						fb.blit(self.__scratch_fb, x, y)
+
+					x += advance
+			finally:
+				self.__close_file(font_file)
+		finally:
+			if self.__lock:
+				self.__lock.release()
+
+		return x, y
+
+	@property
+	def cache(self):
+		return self.__cache
+
+	@property
+	def stats(self):
+		return self.__stats
+
+	@stats.setter
+	def stats(self, stats):
+		'''设置为 FontLibStats 实例开始统计，设置为 None 停止统计'''
+		self.__stats = stats
+
+	@property
+	def hot_count(self):
+		'''常用字表中的字符数量'''
+		return 0 if self.__hot_codes is None else len(self.__hot_codes)
+
+	@property
+	def index_cache_count(self):
+		'''索引缓存中的字符数量，包括从 .idx 附属文件载入的和本次新查找到的'''
+		if self.__index_codes is None:
+			return 0
+
+		return len(self.__index_codes) + len(self.__index_learned)
+
+	@property
+	def segments(self):
+		'''分段索引和范围表中段的数量'''
+		return 0 if self.__segments is None else len(self.__segments) // 5
+
+	@property
+	def has_coverage(self):
+		'''是否已经载入覆盖位图'''
+		return self.__coverage is not None
+
+	@property
+	def placeholder(self):
+		'''占位符 ? 的字符数据，用于代替字库未收录的字符'''
+		return self.__placeholder_buffer
+
+	@property
+	def in_memory(self):
+		'''字库文件是否已经载入内存'''
+		return self.__in_memory
+
+	@property
+	def proportional(self):
+		'''字库是否包含字符宽度表'''
+		return self.__advances is not None
+
+	@property
+	def compressed(self):
+		'''字符数据是否经过压缩'''
+		return self.__header.glyph_compressed
+
+	@property
+	def version(self):
+		return self.__header.version
+
 	@property
 	def scan_mode(self):
 		return self.__header.scan_mode
@@ -200,6 +1905,7 @@ class FontLib(object):
 	def info(self):
 		print('\
 HZK Info: {}\n\
+      version : {}\n\
     file size : {}\n\
    font width : {}\n\
   font height : {}\n\
@@ -209,6 +1915,7 @@ HZK Info: {}\n\
        format : {} ({})\n\
    characters : {}\n'.format(
 			  self.__font_filename,
+			  self.version,
 			  self.file_size,
 			  self.font_width,
 			  self.font_height,
@@ -221,3 +1928,95 @@ HZK Info: {}\n\
 			  FontLib.FORMAT[self.format],
 			  self.characters
 			))
+
+
+class FontStack(object):
+	'''按顺序组合多个点阵尺寸和扫描方式相同的字库，每个字符只从第一个可能收录它的字库中读取
+
+	ranges 为每个字库的编码范围概要，默认使用 FontLib.code_ranges() 计算'''
+	def __init__(self, fonts, ranges=None):
+		if not fonts:
+			raise FontLibException('No font in stack')
+
+		first = fonts[0]
+		for font in fonts[1:]:
+			if (font.font_width, font.font_height, font.scan_mode, font.byte_order) != (first.font_width, first.font_height, first.scan_mode, first.byte_order):
+				raise FontLibException('Font size or scan mode mismatch')
+
+		if ranges is None:
+			ranges = [font.code_ranges() for font in fonts]
+		elif len(ranges) != len(fonts):
+			raise FontLibException('Ranges and fonts count mismatch')
+
+		self.__fonts = list(fonts)
+		self.__ranges = ranges
+
+	@staticmethod
+	def __covers(ranges, unicode):
+		for start, end in ranges:
+			if start <= unicode <= end:
+				return True
+
+		return False
+
+	def get_characters(self, characters: str, placeholder=True):
+		'''获取字符数据，每个字库最多查找一次，都没有收录的字符使用第一个字库的占位符
+
+		返回的字符数据在下次调用对应字库前有效'''
+		result = {}
+		pending = set()
+
+		for char in characters:
+			unicode = ord(char)
+			if unicode in (9, 10, 13): continue
+			pending.add(unicode)
+
+		for font, ranges in zip(self.__fonts, self.__ranges):
+			wanted = ''.join(chr(unicode) for unicode in pending if self.__covers(ranges, unicode))
+			if not wanted:
+				continue
+
+			for unicode, buffer in font.get_characters(wanted, False).items():
+				result[unicode] = buffer
+				pending.discard(unicode)
+
+			if not pending:
+				break
+
+		if placeholder:
+			for unicode in pending:
+				result[unicode] = self.__fonts[0].placeholder
+
+		return result
+
+	def font_of(self, unicode):
+		'''返回编码范围包含该字符的第一个字库，没有时返回 None'''
+		for font, ranges in zip(self.__fonts, self.__ranges):
+			if self.__covers(ranges, unicode):
+				return font
+
+		return None
+
+	@property
+	def fonts(self):
+		return self.__fonts
+
+	@property
+	def ranges(self):
+		return self.__ranges
+
+	@property
+	def font_width(self):
+		return self.__fonts[0].font_width
+
+	@property
+	def font_height(self):
+		return self.__fonts[0].font_height
+
+	@property
+	def data_size(self):
+		return self.__fonts[0].data_size
+
+	@property
+	def format(self):
+		return self.__fonts[0].format
@@ -0,0 +1,283 @@
+"""
+The MIT License (MIT)
+Copyright © 2021 Walkline Wang (https://walkline.wang)
+Gitee: https://gitee.com/walkline/micropython-new-fontlib
+"""
+from utime import ticks_ms, ticks_diff
+from framebuf import FrameBuffer
+from libs.fontlib import TextLayout
+
+try:
+	import _thread
+except ImportError:
+	_thread = None
+
+try:
+	import uasyncio as asyncio
+except ImportError:
+	asyncio = None
+
+
+class PagePrefetcherException(Exception):
+	pass
+
+class PagePrefetcher(object):
+	'''页面预取器，使用 TextLayout 分页（比例字体按字符宽度排列），在当前页面显示期间把之后的 depth 个页面提前绘制到后台 FrameBuffer 中
+
+	可以在线程（start_thread）或协程（run_async）中预取，也可以不启动预取，由 next_page() 按需绘制'''
+	def __init__(self, fontlib, text: str, width, height, depth=1, glyphs=None):
+		if depth < 1:
+			raise PagePrefetcherException('Depth must be at least 1')
+
+		self.__fontlib = fontlib
+		self.__font_width = fontlib.font_width
+		self.__font_height = fontlib.font_height
+		self.__advances = None
+
+		if fontlib.proportional:
+			self.__advances = fontlib.get_advances(text)
+			self.__layout = TextLayout(text, width, height // self.__font_height, self.__advances.get)
+		else:
+			self.__layout = TextLayout(text, width // self.__font_width, height // self.__font_height)
+		self.__glyphs = glyphs
+		self.__page_index = 0
+		self.__depth = depth
+
+		buffer_size = ((width + 7) // 8) * ((height + 7) // 8) * 8
+		self.__slots = [FrameBuffer(bytearray(buffer_size), width, height, fontlib.format) for _ in range(depth + 1)]
+		self.__read_index = 0
+		self.__write_index = 0
+		self.__ready = 0
+		self.__done = False
+
+		self.__glyph_buffer = bytearray(fontlib.data_size)
+		self.__glyph_fb = FrameBuffer(self.__glyph_buffer, self.__font_width, self.__font_height, fontlib.format)
+
+		self.__mode = None
+		self.__state_lock = _thread.allocate_lock() if _thread else None
+		self.__ready_signal = None
+		self.__free_signal = None
+
+		self.__filled = 0
+		self.__stalls = 0
+		self.__stall_time = 0
+
+	def __render(self, fb, lines, buffer_dict):
+		fb.fill(0)
+
+		for row, line in enumerate(lines):
+			x = 0
+			for char in line:
+				unicode = ord(char)
+				if unicode in (9, 13): continue
+
+				self.__glyph_buffer[:] = buffer_dict[unicode]
+				fb.blit(self.__glyph_fb, x, row * self.__font_height)
+				x += self.__font_width if self.__advances is None else self.__advances[unicode]
+
+	def __acquire(self):
+		if self.__state_lock:
+			self.__state_lock.acquire()
+
+	def __release(self):
+		if self.__state_lock:
+			self.__state_lock.release()
+
+	def __next_text(self):
+		'''返回下一页的所有行，没有更多页面时返回 None'''
+		if self.__page_index >= self.__layout.pages:
+			return None
+
+		self.__page_index += 1
+		return self.__layout.page(self.__page_index - 1)
+
+	def __finish(self):
+		self.__acquire()
+		self.__done = True
+		self.__release()
+
+	def __commit(self, lines, buffer_dict):
+		'''把页面绘制到空闲的后台 FrameBuffer 中，然后标记为可用'''
+		self.__render(self.__slots[self.__write_index], lines, buffer_dict)
+		self.__write_index = (self.__write_index + 1) % len(self.__slots)
+		self.__filled += 1
+
+		self.__acquire()
+		self.__ready += 1
+		self.__release()
+
+	def __take(self):
+		'''取出一个可用页面，没有可用页面时返回 None'''
+		self.__acquire()
+		try:
+			if self.__ready == 0:
+				return None
+
+			fb = self.__slots[self.__read_index]
+			self.__read_index = (self.__read_index + 1) % len(self.__slots)
+			self.__ready -= 1
+			return fb
+		finally:
+			self.__release()
+
+	def fill(self):
+		'''同步绘制一个页面，预取页面已满或没有更多页面时返回 False'''
+		if self.__done or self.__ready >= self.__depth:
+			return False
+
+		lines = self.__next_text()
+		if lines is None:
+			self.__finish()
+			return False
+
+		self.__commit(lines, self.__glyphs or self.__fontlib.get_characters(''.join(lines)))
+		return True
+
+	def next_page(self):
+		'''返回下一个页面的 FrameBuffer，在下次调用前有效，没有更多页面时返回 None
+
+		在线程中预取时，页面没有准备好会阻塞等待，没有启动预取时立即绘制，两种情况都会计入 stalls'''
+		fb = self.__take()
+
+		if fb is None and not self.__done:
+			start_time = ticks_ms()
+
+			if self.__mode == 'thread':
+				while fb is None and not self.__done:
+					self.__ready_signal.acquire()
+					fb = self.__take()
+			elif self.__mode is None:
+				self.fill()
+				fb = self.__take()
+			else:
+				raise PagePrefetcherException('Use next_page_async() with run_async()')
+
+			if fb is not None:
+				self.__stalls += 1
+				self.__stall_time += ticks_diff(ticks_ms(), start_time)
+
+		if fb is not None and self.__free_signal is not None:
+			self.__signal(self.__free_signal)
+
+		return fb
+
+	def __signal(self, signal):
+		if self.__mode == 'thread':
+			if signal.locked():
+				signal.release()
+		else:
+			signal.set()
+
+	def start_thread(self):
+		'''在新线程中预取页面'''
+		if _thread is None:
+			raise PagePrefetcherException('_thread is not available')
+
+		self.__mode = 'thread'
+		self.__ready_signal = _thread.allocate_lock()
+		self.__free_signal = _thread.allocate_lock()
+		self.__ready_signal.acquire()
+		self.__free_signal.acquire()
+
+		_thread.start_new_thread(self.__run_thread, ())
+
+	def __run_thread(self):
+		while True:
+			while self.__ready >= self.__depth:
+				self.__free_signal.acquire()
+
+			lines = self.__next_text()
+			if lines is None:
+				break
+
+			self.__commit(lines, self.__glyphs or self.__fontlib.get_characters(''.join(lines)))
+			self.__signal(self.__ready_signal)
+
+		self.__finish()
+		self.__signal(self.__ready_signal)
+
+	async def run_async(self, budget=10):
+		'''在协程中预取页面，读取字符数据时每连续执行 budget 毫秒让出一次事件循环'''
+		if asyncio is None:
+			raise PagePrefetcherException('uasyncio is not available')
+
+		self.__mode = 'async'
+		self.__ready_signal = asyncio.Event()
+		self.__free_signal = asyncio.Event()
+
+		while True:
+			while self.__ready >= self.__depth:
+				self.__free_signal.clear()
+				await self.__free_signal.wait()
+
+			lines = self.__next_text()
+			if lines is None:
+				break
+
+			self.__commit(lines, self.__glyphs or await self.__fontlib.get_characters_async(''.join(lines), budget))
+			self.__ready_signal.set()
+
+		self.__finish()
+		self.__ready_signal.set()
+
+	async def next_page_async(self):
+		'''next_page() 的协程版本，页面没有准备好时等待 run_async() 完成预取'''
+		if self.__mode is None:
+			return self.next_page()
+
+		fb = self.__take()
+
+		if fb is None and not self.__done:
+			start_time = ticks_ms()
+
+			while fb is None and not self.__done:
+				self.__ready_signal.clear()
+				await self.__ready_signal.wait()
+				fb = self.__take()
+
+			if fb is not None:
+				self.__stalls += 1
+				self.__stall_time += ticks_diff(ticks_ms(), start_time)
+
+		if fb is not None:
+			self.__free_signal.set()
+
+		return fb
+
+	@property
+	def layout(self):
+		return self.__layout
+
+	@property
+	def pages(self):
+		'''页面总数'''
+		return self.__layout.pages
+
+	@property
+	def depth(self):
+		return self.__depth
+
+	@property
+	def ready(self):
+		'''已经预取完成的页面数量'''
+		return self.__ready
+
+	@property
+	def filled(self):
+		'''已经绘制的页面数量'''
+		return self.__filled
+
+	@property
+	def stalls(self):
+		'''需要等待页面绘制完成的次数'''
+		return self.__stalls
+
+	@property
+	def stall_time(self):
+		'''等待页面绘制完成的总时间（毫秒）'''
+		return self.__stall_time
+
+	@property
+	def done(self):
+		'''所有页面都已经绘制完成'''
+		return self.__done
@@ -94,7 +94,8 @@ if __name__ == '__main__':
 			'Test1_test3: 每次读取并显示一个字符数据',
 			'Test2: 读取图标字库数据并显示',
 			'Test3_test1: 多线程方式，每次读取一屏字符数据，每次滚动 1 像素',
-			'Test3_test2: 定时器方式，读取所有字符数据，每次滚动 1 像素'
+			'Test3_test2: 定时器方式，读取所有字符数据，每次滚动 1 像素',
+			'Test1_test4: 逐个读取字符数据然后逐屏显示，适合长文本'
 		]
 
 		print('Test List')
@@ -114,7 +115,7 @@ if __name__ == '__main__':
 
 		runner = None
 		if selected:
-			if selected in [1, 2, 3]:
+			if selected in [1, 2, 3, 7]:
 				from tests.fontlibtest1 import FontLibTest1
 				runner = FontLibTest1(oled)
 			elif selected in [5, 6]:
@@ -152,6 +153,10 @@ if __name__ == '__main__':
 				# 定时器方式，读取所有字符数据，每次滚动 1 像素
 				runner.load_font(fontfile)
 				runner.run_test(1, 20, chars2, True)
+			elif selected == 7:
+				# 逐个读取字符数据，显示完整的出师表
+				runner.load_font(fontfile)
+				runner.run_test4(chars3)
 
 		del runner
 		gc.collect()
@@ -28,10 +28,13 @@ class FontLibTest1(object):
 		print('### load font file: {} ms'.format(diff_time))
 		self.__fontlib.info()
 
-		self.__font_width = self.__fontlib.font_height
+		self.__font_width = self.__fontlib.font_width
 		self.__font_height = self.__fontlib.font_height
 		self.__buffer_format = self.__fontlib.format
 
+		self.__glyph_buffer = bytearray(self.__fontlib.data_size)
+		self.__glyph_fb = framebuf.FrameBuffer(self.__glyph_buffer, self.__font_width, self.__font_height, self.__buffer_format)
+
 	def run_test1(self, chars:str=None):
 		'''一次性读取所有字符数据然后逐个显示'''
 		if self.__oled is None or chars is None:
@@ -43,7 +46,7 @@ class FontLibTest1(object):
 		print('### get {} chars: {} ms, avg: {} ms'.format(len(chars), diff_time, diff_time / len(chars)))
 
 		x = y = 0
-		width = height = self.__fontlib.font_height
+		width, height = self.__fontlib.font_width, self.__fontlib.font_height
 
 		start_time = ticks_us()
 		for char in chars:
@@ -81,7 +84,7 @@ class FontLibTest1(object):
 		print('###  get {} chars: {} ms, avg: {} ms'.format(len(chars), diff_time, diff_time / len(chars)))
 
 		x = y = 0
-		width = height = self.__fontlib.font_height
+		width, height = self.__fontlib.font_width, self.__fontlib.font_height
 
 		start_time = ticks_us()
 		for char in chars:
@@ -116,18 +119,16 @@ class FontLibTest1(object):
 			return
 
 		x = y = 0
-		width = height = self.__fontlib.font_height
+		width, height = self.__fontlib.font_width, self.__fontlib.font_height
 
 		start_time = ticks_us()
 		for char in chars:
-			buffer_dict = self.__fontlib.get_characters(char)
-
 			if ord(char) == 10:
 				x = 0
 				y += height
 				continue
 
-			buffer = memoryview(buffer_dict[ord(char)])
+			self.__fontlib.get_character_into(ord(char), self.__glyph_buffer)
 
 			if x > ((self.__oled_width // width - 1) * width):
 				x = 0
@@ -139,12 +140,49 @@ class FontLibTest1(object):
 				sleep(1.5)
 				self.__oled.fill(0)
  
-			self.__fill_buffer(buffer, x, y, self.__buffer_format)
+			self.__fill_buffer(self.__glyph_fb, x, y, self.__buffer_format)
 			self.__oled.show()
 			x += width
 		diff_time = ticks_diff(ticks_us(), start_time) / 1000
 		print('### show {} chars: {} ms, avg: {} ms'.format(len(chars), diff_time, diff_time / len(chars)))
 
+	def run_test4(self, chars:str=None):
+		'''逐个读取字符数据并逐屏显示，占用的内存与文字长度无关'''
+		if self.__oled is None or chars is None:
+			return
+
+		x = y = 0
+		width, height = self.__fontlib.font_width, self.__fontlib.font_height
+
+		start_time = ticks_us()
+		for char, buffer in self.__fontlib.iter_glyphs(chars):
+			if ord(char) == 10:
+				x = 0
+				y += height
+				continue
+
+			if buffer is None:
+				continue
+
+			if x > ((self.__oled_width // width - 1) * width):
+				x = 0
+				y += height
+
+			if y > ((self.__oled_height // height - 1) * height):
+				self.__oled.show()
+				self.__oled.fill(0)
+				sleep(3)
+				x = y = 0
+
+			self.__glyph_buffer[:] = buffer
+			self.__fill_buffer(self.__glyph_fb, x, y, self.__buffer_format)
+			x += width
+
+		self.__oled.show()
+
+		diff_time = ticks_diff(ticks_us(), start_time) / 1000
+		print('### show {} chars: {} ms, avg: {} ms'.format(len(chars), diff_time, diff_time / len(chars)))
+
 	def __fill_buffer(self, buffer, x, y, format):
 		if isinstance(buffer, (bytes, memoryview)):
 			buffer = framebuf.FrameBuffer(bytearray(buffer), self.__font_width, self.__font_height, format)
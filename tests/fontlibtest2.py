@@ -4,7 +4,7 @@ Copyright © 2021 Walkline Wang (https://walkline.wang)
 Gitee: https://gitee.com/walkline/micropython-new-fontlib
 """
 import framebuf
-from libs.fontlib import FontLib
+from libs.fontlib import FontLib, FontStack
 
 
 class FontLibTest2(object):
@@ -27,22 +27,17 @@ class FontLibTest2(object):
 		welcome.info()
 		iconic.info()
 
-		welcome_buffer_dict = welcome.get_characters('欢迎')
-		iconic_buffer_dict = iconic.get_characters('\ue056\ue057')
+		# 文字和图标混合在一起，一次读取
+		chars = '\ue056欢迎\ue057'
+		stack = FontStack([welcome, iconic])
+		buffer_dict = stack.get_characters(chars)
 
-		width = height = welcome.font_height
-		x = int((self.__oled_width - width * 4) / 2)
+		width, height = stack.font_width, stack.font_height
+		x = int((self.__oled_width - width * len(chars)) / 2)
 		y = int((self.__oled_height - height) / 2)
 
-		buffer_list = [
-			memoryview(iconic_buffer_dict[ord('\ue056')]),
-			memoryview(welcome_buffer_dict[ord('欢')]),
-			memoryview(welcome_buffer_dict[ord('迎')]),
-			memoryview(iconic_buffer_dict[ord('\ue057')])
-		]
-
-		for buffer in buffer_list:
-			self.__fill_buffer(buffer, width, height, x, y, welcome.format)
+		for char in chars:
+			self.__fill_buffer(memoryview(buffer_dict[ord(char)]), width, height, x, y, stack.format)
 			x += width
 
 		self.__oled.show()
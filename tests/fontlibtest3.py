@@ -7,6 +7,7 @@ from utime import sleep
 from machine import Timer
 import framebuf
 from libs.fontlib import FontLib
+from libs.prefetcher import PagePrefetcher
 import _thread
 
 
@@ -22,11 +23,9 @@ class FontLibTest3(object):
 			self.__oled_height = self.__oled.height
 
 	def load_font(self, font_file):
-		self.__fontlib = FontLib(font_file)
+		self.__fontlib = FontLib(font_file, keep_open=True)
 		self.__fontlib.info()
 
-		self.__font_width = self.__fontlib.font_height
-		self.__font_height = self.__fontlib.font_height
 		self.__buffer_format = self.__fontlib.format
 
 	def run_test(self, scroll_height:int=1, interval:int=20, chars:str=None, load_all:bool=False, thread:bool=False):
@@ -35,22 +34,23 @@ class FontLibTest3(object):
 
 		self.__scroll_speed = scroll_height
 		self.__scroll_interval = interval
-		self.__chars = chars.replace('\t', '').replace('\r\n', '\n')
-		self.__load_all = load_all
 		self.__thread = thread
 
+		glyphs = self.__fontlib.get_characters(chars) if load_all else None
+		self.__prefetcher = PagePrefetcher(self.__fontlib, chars, self.__oled_width, self.__oled_height, 1, glyphs)
 		self.__setup()
-		self.__fill_page(2, True)
+
+		if self.__thread:
+			self.__prefetcher.start_thread()
+
+		self.__fb_foreground.blit(self.__prefetcher.next_page(), 0, 0)
+		self.__next_page()
 
 		self.__oled.blit(self.__fb_foreground, 0, 0)
 		self.__oled.show()
 
-		self.__page_prepared = True
-		if self.__thread:
-			self.__need_next_page = True
-			_thread.start_new_thread(self.__fill_page_thread, ())
-		else:
-			self.__fill_page()
+		if not self.__thread:
+			self.__prefetcher.fill()
 
 		sleep(1)
 
@@ -64,148 +64,51 @@ class FontLibTest3(object):
 			)
 
 	def __setup(self):
-		self.__chars_per_row = int(self.__oled_width / self.__fontlib.font_height)
-		self.__chars_per_col = int(self.__oled_height / self.__fontlib.font_height)
-		self.__chars_per_page = self.__chars_per_row * self.__chars_per_col
-
-		self.__total_rows = int(len(self.__chars) / self.__chars_per_row) + self.__chars.count('\n')
-		self.__total_pages = int(self.__total_rows / self.__chars_per_col)
-
 		self.__buffer_size = self.__oled_width // 8 * self.__oled_height
 		self.__fb_foreground = framebuf.FrameBuffer(bytearray(self.__buffer_size * 2), self.__oled_width, self.__oled_height * 2, self.__buffer_format)
-		self.__fb_background = framebuf.FrameBuffer(bytearray(self.__buffer_size), self.__oled_width, self.__oled_height, self.__buffer_format)
 
 		self.__scroll_timer = Timer(1)
-		self.__buffer_dict = self.__fontlib.get_characters(self.__chars) if self.__load_all else {}
-
-		self.__need_next_page = False
-		self.__page_prepared = False
-		self.__current_page = 0
-		self.__x = self.__y = 0
-		self.__current_char_index = 0
-
-	def __fill_buffer(self, buffer):
-		return framebuf.FrameBuffer(bytearray(buffer), self.__font_width, self.__font_height, self.__buffer_format)
-
-	def __fill_page(self, num:int=1, first:bool=False):
-		x = y = 0
-		while num:
-			col = 0
-			current_page_chars = self.__chars[self.__current_char_index:self.__current_char_index + self.__chars_per_page]
+		self.__y = 0
 
-			if not self.__load_all:
-				self.__buffer_dict = self.__fontlib.get_characters(current_page_chars)
+	def __next_page(self):
+		'''把下一页放到前台 FrameBuffer 的下半部分，没有更多页面时返回 False'''
+		page = self.__prefetcher.next_page()
+		if page is None:
+			return False
 
-			self.__fb_background.fill(0)
-
-			for char in current_page_chars:
-				if ord(char) == 10:
-					x = 0
-					y += self.__font_height
-					col += 1
-					self.__current_char_index += 1
-					continue
-
-				if x > ((self.__oled_width // self.__font_width - 1) * self.__font_width):
-					x = 0
-					y += self.__font_height
-					col += 1
-
-				if col >= self.__chars_per_col:
-					break
-
-				# print(char, end='')
-
-				buffer = self.__fill_buffer(memoryview(self.__buffer_dict[ord(char)]))
-				self.__fb_foreground.blit(buffer, x, y) if first else self.__fb_background.blit(buffer, x, y)
-				x += self.__font_width
-				self.__current_char_index += 1
-
-			num -= 1
-			self.__current_page += 1
-		self.__page_prepared = True
-
-	def __scroll_cb(self, timer):
-		if self.__current_page > self.__total_pages:
-			self.__scroll_timer.deinit()
-			return
+		self.__fb_foreground.blit(page, 0, self.__oled_height)
+		return True
 
+	def __scroll(self):
+		'''滚动一次，当前页面滚动完成后换页，所有页面显示完成时返回 False'''
 		if self.__y >= self.__oled_height:
-			if not self.__page_prepared:
-				return
-
-			self.__fb_foreground.blit(self.__fb_background, 0, self.__oled_height)
-			# print('page ', self.__current_page, ' used')
+			if not self.__next_page():
+				return False
 
-			self.__page_prepared = False
-			self.__fill_page()
-			self.__x = self.__y = 0
+			self.__y = 0
 
 		self.__fb_foreground.scroll(0, self.__scroll_speed * -1)
 		self.__oled.blit(self.__fb_foreground, 0, 0)
 		self.__oled.show()
 		self.__y += self.__scroll_speed
 
-	def __scroll_thread(self):
-		while self.__current_page <= self.__total_pages:
-			if self.__y >= self.__oled_height:
-				if not self.__page_prepared:
-					continue
+		return True
 
-				self.__fb_foreground.blit(self.__fb_background, 0, self.__oled_height)
-				# print('page ', self.__current_page, ' used')
+	def __print_stats(self):
+		print('### pages: {}/{}, stalls: {}, stall time: {} ms'.format(self.__prefetcher.filled, self.__prefetcher.pages, self.__prefetcher.stalls, self.__prefetcher.stall_time))
 
-				self.__page_prepared = False
-				self.__need_next_page = True
-				self.__x = self.__y = 0
-				self.__current_page += 1
+	def __scroll_cb(self, timer):
+		if not self.__scroll():
+			self.__scroll_timer.deinit()
+			self.__print_stats()
+			return
 
-			self.__fb_foreground.scroll(0, self.__scroll_speed * -1)
-			self.__oled.blit(self.__fb_foreground, 0, 0)
-			self.__oled.show()
-			self.__y += self.__scroll_speed
+		# 预取页面已满时 fill() 会立即返回
+		self.__prefetcher.fill()
 
+	def __scroll_thread(self):
+		while self.__scroll():
 			sleep(self.__scroll_interval / 1000)
-		print('thread scroll exit')
-
-	def __fill_page_thread(self):
-		while self.__current_page < self.__total_pages:
-			if self.__need_next_page:
-				# print('filling page ', self.__current_page)
-				col = x = y = 0
-				current_page_chars = self.__chars[self.__current_char_index:self.__current_char_index + self.__chars_per_page]
 
-				if not self.__load_all:
-					self.__buffer_dict = self.__fontlib.get_characters(current_page_chars)
-
-				self.__fb_background.fill(0)
-
-				for char in current_page_chars:
-					if ord(char) == 10:
-						x = 0
-						y += self.__font_height
-						col += 1
-						self.__current_char_index += 1
-						continue
-
-					if x > ((self.__oled_width // self.__font_width - 1) * self.__font_width):
-						x = 0
-						y += self.__font_height
-						col += 1
-
-					if col >= self.__chars_per_col:
-						break
-
-					# print(char, end='')
-
-					buffer = self.__fill_buffer(memoryview(self.__buffer_dict[ord(char)]))
-					self.__fb_background.blit(buffer, x, y)
-					x += self.__font_width
-					self.__current_char_index += 1
-
-				# print('\npage: ', self.__current_page, ' filled')
-				self.__page_prepared = True
-				self.__need_next_page = False
-
-		self.__page_prepared = True
-		print('thread fill page exit')
+		self.__print_stats()
+		print('thread scroll exit')